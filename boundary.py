@@ -0,0 +1,529 @@
+# Filename: 'boundary.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module holds the stages used by 'boundary_generation.py'.
+# Reduction removes the points inside any number of exclusion regions (rectangles or polygons from a shapefile such
+# as the 'reductionbounds.shp' written by 'test_files/bounds_vis.py'). A coarse lookup grid over the regions marks
+# each cell as fully inside a region, clear of every region or on a region edge, so most points are classified with
+# one array lookup and only points in edge cells are tested exactly against the few regions touching their cell.
+# The alpha shape (concave hull) keeps the Delaunay triangles with a circumradius below 1 / alpha and finds the edges
+# used by exactly one kept triangle by sorting the edge arrays, then chains those edges into rings (outer rings and
+# holes, of any number of parts) before any shapely geometry is built. Credit to Kevin Dwyer and Simon Cozens for the
+# original alpha_shape function (https://gist.github.com/dwyerk/10561690).
+# AlphaSweep triangulates once and keeps the triangles sorted by circumradius, so the area, perimeter, part count and
+# hole count of the alpha shape can be reported for many alpha values, or an alpha chosen automatically, cheaply.
+# On large surveys the alpha shape can be built from overlapping tiles triangulated in a process pool, each tile
+# keeping the triangles whose centroid is inside it, with the tiles' boundary edges merged by the same edge counting.
+# For very large surveys the boundary can instead be taken from an occupancy raster: points are binned into cells in
+# one streaming pass, gaps are closed morphologically and holes filled, and the cell edges between occupied and empty
+# cells are chained into rings in the same way as the alpha shape edges. Memory is set by the raster size.
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fiona
+import numpy as np
+import shapely
+import shapely.geometry as geometry
+from scipy import ndimage
+from scipy.spatial import Delaunay, QhullError
+
+import instrumentation
+from ingest import write_npy_header
+from point_store import TileIndex
+
+
+def rectangles_to_regions(left, bottom, right, top):
+    """
+    Convert lists of rectangle bounds into exclusion polygons.
+    left, bottom, right, top: lists with one entry per rectangle.
+    """
+    return [geometry.box(l, b, r, t) for l, b, r, t in zip(left, bottom, right, top)]
+
+
+def read_regions(path):
+    """
+    Read every polygon of a shapefile as exclusion regions.
+    path: path to the shapefile.
+    """
+    with fiona.open(path) as features:
+        return [geometry.shape(feature['geometry']) for feature in features]
+
+
+class RegionIndex:
+    """
+    Lookup grid over a set of exclusion regions for fast point classification.
+    regions: list of shapely polygons.
+    cells: number of lookup cells along each side of the regions' bounding box.
+    """
+
+    INSIDE, OUTSIDE, EDGE = 0, 1, 2
+
+    def __init__(self, regions, cells=256):
+        self.regions = list(regions)
+        for region in self.regions:
+            shapely.prepare(region)
+        self.cells = cells
+        self.xmin, self.ymin, self.xmax, self.ymax = shapely.total_bounds(self.regions)
+        self.dx = max(self.xmax - self.xmin, 1e-9) / cells
+        self.dy = max(self.ymax - self.ymin, 1e-9) / cells
+
+        ix, iy = np.meshgrid(np.arange(cells), np.arange(cells))
+        x0, y0 = self.xmin + ix.ravel() * self.dx, self.ymin + iy.ravel() * self.dy
+        boxes = shapely.box(x0, y0, x0 + self.dx, y0 + self.dy)
+        tree = shapely.STRtree(self.regions)
+        self.state = np.full(cells * cells, self.OUTSIDE, dtype=np.int8)
+        touching_cells, touching_regions = tree.query(boxes, predicate='intersects')
+        self.state[touching_cells] = self.EDGE
+        inside_cells, _ = tree.query(boxes, predicate='within')
+        self.state[inside_cells] = self.INSIDE
+
+        # regions to test for each edge cell, as a cell-sorted list of (cell, region) pairs
+        edge = self.state[touching_cells] == self.EDGE
+        order = np.argsort(touching_cells[edge], kind='stable')
+        self.pair_cells = touching_cells[edge][order]
+        self.pair_regions = touching_regions[edge][order]
+
+    def contains(self, x, y):
+        """
+        Return a boolean mask of the points inside (or on the edge of) any region.
+        x, y: point coordinates.
+        """
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        inside = np.zeros(x.shape, dtype=bool)
+        near = (x >= self.xmin) & (x <= self.xmax) & (y >= self.ymin) & (y <= self.ymax)
+        candidates = np.flatnonzero(near)
+        ix = np.minimum(((x[candidates] - self.xmin) / self.dx).astype(np.int64), self.cells - 1)
+        iy = np.minimum(((y[candidates] - self.ymin) / self.dy).astype(np.int64), self.cells - 1)
+        cell = iy * self.cells + ix
+        state = self.state[cell]
+        inside[candidates[state == self.INSIDE]] = True
+
+        # exact test only for points in edge cells, against the regions touching their cell
+        edge = state == self.EDGE
+        points, cell = candidates[edge], cell[edge]
+        first = np.searchsorted(self.pair_cells, cell, side='left')
+        last = np.searchsorted(self.pair_cells, cell, side='right')
+        for k in range(int((last - first).max(initial=0))):
+            has = first + k < last
+            pair = first[has] + k
+            for region in np.unique(self.pair_regions[pair]):
+                test = points[has][self.pair_regions[pair] == region]
+                test = test[~inside[test]]
+                inside[test] = shapely.intersects_xy(self.regions[region], x[test], y[test])
+        return inside
+
+
+def reduce_points(x, y, regions, output_file, chunk_rows=4 * 1024 ** 2):
+    """
+    Write the x, y points outside every exclusion region to an (n, 2) .npy file, returning the number kept.
+    Points are processed chunk_rows at a time and appended to the output, so memory use does not grow with the survey.
+    x, y: point coordinates (may be memory-mapped).
+    regions: list of shapely polygons, or a RegionIndex.
+    output_file: path of the .npy file to write.
+    chunk_rows: number of points processed at a time.
+    """
+    index = regions if isinstance(regions, RegionIndex) else RegionIndex(regions)
+    kept = 0
+    with open(output_file, 'wb') as dst:
+        write_npy_header(dst, 0, 2)
+        for start in range(0, len(x), chunk_rows):
+            xs, ys = np.asarray(x[start:start + chunk_rows]), np.asarray(y[start:start + chunk_rows])
+            keep = ~index.contains(xs, ys)
+            np.column_stack((xs[keep], ys[keep])).astype(np.float64).tofile(dst)
+            kept += int(keep.sum())
+        write_npy_header(dst, kept, 2)
+    return kept
+
+
+def triangulate(points):
+    """
+    Delaunay triangulation of (n, 2) points, returning the triangles as (m, 3) vertex indices in counter-clockwise
+    order.
+    """
+    # centre the points first, qhull loses precision on raw UTM coordinates and drops or overlaps triangles
+    with instrumentation.hot('delaunay', len(points)):
+        simplices = Delaunay(points - points.mean(axis=0)).simplices
+    a, b, c = points[simplices[:, 0]], points[simplices[:, 1]], points[simplices[:, 2]]
+    clockwise = ((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])) < 0
+    simplices[clockwise] = simplices[clockwise][:, [0, 2, 1]]
+    return simplices
+
+
+def circumradii(points, simplices):
+    """
+    Circumradius of every triangle, infinite for degenerate (zero area) triangles.
+    """
+    a, b, c = points[simplices[:, 0]], points[simplices[:, 1]], points[simplices[:, 2]]
+    ab = np.hypot(*(a - b).T)
+    bc = np.hypot(*(b - c).T)
+    ca = np.hypot(*(c - a).T)
+    area = np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(area > 0, ab * bc * ca / (4.0 * area), np.inf)
+
+
+def boundary_edges(simplices):
+    """
+    Return the directed edges (start, end) used by exactly one of the given counter-clockwise triangles.
+    The kept triangles are always on the left of each edge, so outer rings run counter-clockwise and holes clockwise.
+    """
+    return unique_edges(simplices.ravel(), simplices[:, [1, 2, 0]].ravel())
+
+
+def unique_edges(start, end):
+    """
+    Return the directed edges (start, end) whose undirected edge appears only once, e.g. the boundary edges of tiles
+    merged together, where an edge found on the boundary of two neighbouring tiles is inside the merged shape.
+    """
+    key = np.minimum(start, end).astype(np.int64) * (int(max(start.max(initial=0), end.max(initial=0))) + 1) +\
+        np.maximum(start, end)
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    unique = np.ones(key.size, dtype=bool)
+    unique[1:] &= key[1:] != key[:-1]
+    unique[:-1] &= key[:-1] != key[1:]
+    return start[order][unique], end[order][unique]
+
+
+def chain_rings(start, end, points):
+    """
+    Chain directed boundary edges into closed rings, returned as lists of vertex indices (first vertex not repeated).
+    Where several rings meet at one vertex, each ring leaves it by the first edge clockwise from the one it arrived
+    on, so it follows the edge of the same kept region. A ring that still passes through a vertex twice (a hole
+    touching its outer ring at a point) is split there so that every ring is simple.
+    """
+    order = np.argsort(start, kind='stable')
+    start, end = start[order], end[order]
+    first = np.searchsorted(start, np.arange(len(points) + 1))
+    count = np.diff(first)
+
+    # next edge of each edge along its ring, only vertices shared by several rings need the angle test
+    following = first[end]
+    for e in np.flatnonzero(count[end] > 1):
+        v = end[e]
+        candidates = np.arange(first[v], first[v + 1])
+        back = np.arctan2(*(points[start[e]] - points[v])[::-1])
+        out = np.arctan2(points[end[candidates], 1] - points[v, 1], points[end[candidates], 0] - points[v, 0])
+        clockwise = np.mod(back - out, 2 * np.pi)
+        following[e] = candidates[np.argmin(np.where(clockwise > 0, clockwise, 2 * np.pi))]
+
+    following, start = following.tolist(), start.tolist()
+    used = [False] * len(start)
+    rings = []
+    for e0 in range(len(start)):
+        if used[e0]:
+            continue
+        ring, seen = [], {}
+        e = e0
+        while not used[e]:
+            used[e] = True
+            v = start[e]
+            if v in seen:
+                # back at a vertex of this ring, split the loop since then off as its own ring
+                loop = ring[seen[v]:]
+                del ring[seen[v]:]
+                for u in loop:
+                    del seen[u]
+                rings.append(loop)
+            seen[v] = len(ring)
+            ring.append(v)
+            e = following[e]
+        rings.append(ring)
+    return rings
+
+
+def rings_to_geometry(points, rings):
+    """
+    Build a Polygon or MultiPolygon from counter-clockwise outer rings and clockwise holes.
+    Each hole is given to the smallest outer ring that covers it.
+    """
+    with instrumentation.hot('polygonize', len(rings)):
+        coords = [points[ring] for ring in rings if len(ring) >= 3]
+        area = np.array([np.sum(c[:, 0] * np.roll(c[:, 1], -1) - np.roll(c[:, 0], -1) * c[:, 1]) / 2 for c in coords])
+        shells = [geometry.Polygon(c) for c, a in zip(coords, area) if a > 0]
+        holes = [geometry.Polygon(c) for c, a in zip(coords, area) if a < 0]
+        if not shells:
+            return geometry.Polygon()
+
+        shell_holes = [[] for _ in shells]
+        if holes:
+            shell_area = np.array([shell.area for shell in shells])
+            hole_index, shell_index = shapely.STRtree(shells).query(holes, predicate='covered_by')
+            owner = {}
+            for h, k in zip(hole_index, shell_index):
+                if h not in owner or shell_area[k] < shell_area[owner[h]]:
+                    owner[h] = k
+            for h, k in owner.items():
+                shell_holes[k].append(holes[h].exterior.coords)
+
+        polygons = [geometry.Polygon(shell.exterior.coords, interiors) for shell, interiors in zip(shells, shell_holes)]
+        return polygons[0] if len(polygons) == 1 else geometry.MultiPolygon(polygons)
+
+
+def alpha_shape(points, alpha):
+    """
+    Compute the alpha shape (concave hull) of a set of points.
+    points: (n, 2) array of points.
+    alpha: alpha value to influence the gooeyness of the border, triangles with a circumradius of 1 / alpha or more
+    are dropped. Smaller numbers don't fall inward as much as larger numbers. Too large, and you lose everything!
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 4:
+        # When you have a triangle, there is no sense
+        # in computing an alpha shape.
+        return geometry.MultiPoint(points).convex_hull
+
+    simplices = triangulate(points)
+    kept = simplices[circumradii(points, simplices) < (1.0 / alpha)]
+    return rings_to_geometry(points, chain_rings(*boundary_edges(kept), points))
+
+
+class AlphaSweep:
+    """
+    Delaunay triangulation and circumradii of a point set computed once, for evaluating many alpha values.
+    points: (n, 2) array of points.
+    simplices: optional counter-clockwise triangles from triangulate (e.g. loaded from a cache), computed when None.
+    """
+
+    def __init__(self, points, simplices=None):
+        self.points = np.asarray(points, dtype=np.float64)
+        simplices = triangulate(self.points) if simplices is None else simplices
+        radii = circumradii(self.points, simplices)
+        order = np.argsort(radii, kind='stable')
+        # triangles sorted by circumradius, so the triangles kept for any alpha are a prefix of the array
+        self.simplices, self.radii = simplices[order], radii[order]
+        self.vertices = np.unique(self.simplices)  # points used by the triangulation (duplicates are left out)
+
+    def save(self, path):
+        """
+        Save the triangulation to an .npz file.
+        """
+        np.savez(path, points=self.points, simplices=self.simplices)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a triangulation saved with save.
+        """
+        with np.load(path) as cached:
+            return cls(cached['points'], cached['simplices'])
+
+    def kept(self, alpha):
+        """
+        Triangles with a circumradius below 1 / alpha.
+        """
+        return self.simplices[:np.searchsorted(self.radii, 1.0 / alpha, side='left')]
+
+    def shape(self, alpha):
+        """
+        Alpha shape geometry for one alpha, as alpha_shape(points, alpha).
+        """
+        return rings_to_geometry(self.points, chain_rings(*boundary_edges(self.kept(alpha)), self.points))
+
+    def summary(self, alpha):
+        """
+        Area, perimeter, number of parts and holes, and fraction of points covered by the alpha shape for one alpha.
+        """
+        kept = self.kept(alpha)
+        p = self.points
+        a, b, c = p[kept[:, 0]], p[kept[:, 1]], p[kept[:, 2]]
+        area = np.sum((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])) / 2
+        start, end = boundary_edges(kept)
+        perimeter = np.sum(np.hypot(*(p[end] - p[start]).T))
+        rings = [ring for ring in chain_rings(start, end, p) if len(ring) >= 3]
+        signed = np.array([np.sum(p[ring, 0] * np.roll(p[ring, 1], -1) - np.roll(p[ring, 0], -1) * p[ring, 1])
+                           for ring in rings])
+        covered = np.zeros(len(p), dtype=bool)
+        covered[kept.ravel()] = True
+        return {'alpha': float(alpha), 'area': float(area), 'perimeter': float(perimeter),
+                'parts': int(np.sum(signed > 0)), 'holes': int(np.sum(signed < 0)),
+                'covered': float(covered[self.vertices].mean())}
+
+    def sweep(self, alphas):
+        """
+        Summaries for a list of alpha values.
+        """
+        return [self.summary(alpha) for alpha in alphas]
+
+    def auto_alpha(self, target='single'):
+        """
+        Largest alpha (tightest shape) meeting a target, found by bisection over the sorted circumradii.
+        Assumes that once an alpha meets the target, every smaller alpha does too.
+        target: 'single' for one polygon that covers every point, or 'single_no_holes' to also forbid holes.
+        """
+        if target not in ('single', 'single_no_holes'):
+            raise ValueError("Choose a target! 'single' or 'single_no_holes'")
+
+        def meets(k):
+            kept = self.simplices[:k]
+            covered = np.zeros(len(self.points), dtype=bool)
+            covered[kept.ravel()] = True
+            if not covered[self.vertices].all():
+                return False
+            summary = self.summary(1.0 / self.radii[k])
+            return summary['parts'] == 1 and (target == 'single' or summary['holes'] == 0)
+
+        # candidate alphas are 1 / radius of each finite triangle, keeping the triangles before it
+        finite = int(np.searchsorted(self.radii, np.inf))
+        lo, hi = 1, finite - 1
+        if hi < lo or not meets(hi):
+            raise ValueError('No alpha meets the target %r' % target)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if meets(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return 1.0 / self.radii[lo]
+
+
+def parallel_alpha_shape(points, alpha, tile_size=None, workers=None):
+    """
+    Compute the alpha shape (as alpha_shape) by triangulating overlapping square tiles of the points in parallel.
+    Each tile is triangulated with the points within 2 / alpha of it and keeps the triangles below the alpha radius
+    whose centroid lies inside it. The circumcircle of such a triangle lies inside the grown tile, so the tile finds
+    exactly the triangles of the global triangulation and every kept triangle belongs to one tile only. The tiles
+    return the edges used once within them and edges found by two neighbouring tiles are dropped, so the merged rings
+    have no seams, gaps or slivers.
+    points: (n, 2) array of points (may be memory-mapped).
+    alpha: alpha value, triangles with a circumradius of 1 / alpha or more are dropped.
+    tile_size: side length of the tiles in metres, None aims for about four tiles per worker.
+    workers: number of worker processes, defaults to the number of cores.
+    """
+    x, y = points[:, 0], points[:, 1]
+    workers = workers or os.cpu_count()
+    x0, y0, x1, y1 = x.min(), y.min(), x.max(), y.max()
+    if tile_size is None:
+        tile_size = max(np.sqrt((x1 - x0) * (y1 - y0) / (4 * workers)), 4.0 / alpha)
+    ntx, nty = int((x1 - x0) // tile_size) + 1, int((y1 - y0) // tile_size) + 1
+    index = TileIndex.build(x, y, x0, y0, tile_size, ntx, nty)
+    margin = 2.0 / alpha * 1.001
+
+    def tasks():
+        for ty in range(nty):
+            for tx in range(ntx):
+                lo_x, lo_y = x0 + tx * tile_size, y0 + ty * tile_size
+                idx = index.window(x, y, lo_x - margin, lo_x + tile_size + margin, lo_y - margin,
+                                   lo_y + tile_size + margin)
+                if index.offsets[ty * ntx + tx + 1] > index.offsets[ty * ntx + tx]:  # tiles without points add nothing
+                    yield idx, np.column_stack((x[idx], y[idx])), ty * ntx + tx, (x0, y0, tile_size, ntx, nty), alpha
+
+    starts, ends = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        jobs = tasks()
+        done = False
+        while pending or not done:
+            while not done and len(pending) < 2 * workers:  # bound the number of tiles in flight
+                try:
+                    pending.append(pool.submit(_alpha_tile, next(jobs)))
+                except StopIteration:
+                    done = True
+            if pending:
+                start, end = pending.popleft().result()
+                starts.append(start)
+                ends.append(end)
+    if not starts:
+        return geometry.Polygon()
+    start, end = unique_edges(np.concatenate(starts), np.concatenate(ends))
+    return rings_to_geometry(points, chain_rings(start, end, points))
+
+
+def _alpha_tile(task):
+    idx, local, tile, grid, alpha = task
+    if len(local) < 3:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # a tiny jitter fixed by each point's global index gives every tile the same unique triangulation where points
+    # are cocircular (e.g. gridded soundings), otherwise neighbouring tiles could split such a quad differently
+    local = local + 1e-6 * (np.column_stack((idx * 0.6180339887, idx * 0.7548776662)) % 1.0 - 0.5)
+    try:
+        simplices = triangulate(local)
+    except QhullError:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    simplices = simplices[circumradii(local, simplices) < (1.0 / alpha)]
+    centroid = local[simplices].mean(axis=1)
+    simplices = simplices[TileIndex._tile_ids(centroid[:, 0], centroid[:, 1], *grid) == tile]
+    start, end = boundary_edges(simplices)
+    return idx[start], idx[end]
+
+
+def occupancy_raster(x, y, cell_size, chunk_rows=4 * 1024 ** 2):
+    """
+    Mark the raster cells containing at least one point, returning (occupied, x0, y0) with occupied[row, column].
+    Points are read chunk_rows at a time, in one pass for the bounds and one for the cells.
+    x, y: point coordinates (may be memory-mapped).
+    cell_size: side length of a cell in metres.
+    """
+    x0, y0, x1, y1 = np.inf, np.inf, -np.inf, -np.inf
+    for start in range(0, len(x), chunk_rows):
+        xs, ys = x[start:start + chunk_rows], y[start:start + chunk_rows]
+        x0, y0, x1, y1 = min(x0, xs.min()), min(y0, ys.min()), max(x1, xs.max()), max(y1, ys.max())
+    nx, ny = int((x1 - x0) // cell_size) + 1, int((y1 - y0) // cell_size) + 1
+
+    occupied = np.zeros((ny, nx), dtype=bool)
+    for start in range(0, len(x), chunk_rows):
+        ix = ((x[start:start + chunk_rows] - x0) // cell_size).astype(np.int64)
+        iy = ((y[start:start + chunk_rows] - y0) // cell_size).astype(np.int64)
+        occupied[iy, ix] = True
+    return occupied, x0, y0
+
+
+def raster_to_geometry(occupied, x0, y0, cell_size):
+    """
+    Outline the occupied cells of a raster as a Polygon or MultiPolygon (with holes).
+    occupied: boolean raster, occupied[row, column] with row 0 at y0.
+    x0, y0: coordinates of the lower left corner of the raster.
+    cell_size: side length of a cell in metres.
+    """
+    ny, nx = occupied.shape
+    padded = np.pad(occupied, 1)
+    corner = lambda i, j: j * (nx + 1) + i  # noqa: E731, corner (i, j) is at x0 + i * cell_size, y0 + j * cell_size
+
+    # edges between occupied and empty cells, directed with the occupied cell on the left
+    below, above = padded[:-1, 1:-1], padded[1:, 1:-1]  # cells either side of each horizontal edge
+    j, i = np.nonzero(above & ~below)
+    starts, ends = [corner(i, j)], [corner(i + 1, j)]
+    j, i = np.nonzero(below & ~above)
+    starts.append(corner(i + 1, j))
+    ends.append(corner(i, j))
+    left, right = padded[1:-1, :-1], padded[1:-1, 1:]  # cells either side of each vertical edge
+    j, i = np.nonzero(right & ~left)
+    starts.append(corner(i, j + 1))
+    ends.append(corner(i, j))
+    j, i = np.nonzero(left & ~right)
+    starts.append(corner(i, j))
+    ends.append(corner(i, j + 1))
+
+    # number only the corners on the outline, the full corner grid can be far larger
+    used, compact = np.unique(np.concatenate(starts + ends), return_inverse=True)
+    start, end = np.split(compact, 2)
+    points = np.column_stack((x0 + (used % (nx + 1)) * cell_size, y0 + (used // (nx + 1)) * cell_size))
+    shape = rings_to_geometry(points, chain_rings(start, end, points))
+    return shape.simplify(0)  # drop the corners along straight runs of cell edges
+
+
+def raster_boundary(x, y, cell_size, closing_radius=2, max_hole_area=None, chunk_rows=4 * 1024 ** 2):
+    """
+    Boundary of a point set from an occupancy raster, in linear time and with memory set by the raster size.
+    x, y: point coordinates (may be memory-mapped).
+    cell_size: side length of a raster cell in metres.
+    closing_radius: radius in cells of the morphological closing that bridges gaps between survey lines.
+    max_hole_area: holes smaller than this (in square metres) are filled, None fills every hole.
+    chunk_rows: number of points read at a time.
+    """
+    occupied, x0, y0 = occupancy_raster(x, y, cell_size, chunk_rows)
+    if closing_radius > 0:
+        r = int(closing_radius)
+        disk = np.hypot(*np.mgrid[-r:r + 1, -r:r + 1]) <= closing_radius
+        # pad first so the closing does not erode cells at the edge of the raster
+        occupied = ndimage.binary_closing(np.pad(occupied, r), structure=disk)[r:-r, r:-r]
+    if max_hole_area is None:
+        occupied = ndimage.binary_fill_holes(occupied)
+    else:
+        holes, count = ndimage.label(ndimage.binary_fill_holes(occupied) & ~occupied)
+        small = np.flatnonzero(np.bincount(holes.ravel())[1:] * cell_size ** 2 < max_hole_area) + 1
+        occupied |= np.isin(holes, small)
+    return raster_to_geometry(occupied, x0, y0, cell_size)
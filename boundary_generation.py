@@ -3,89 +3,92 @@
 # Author: Connor Jordan
 # Institution: University of Edinburgh (IIE)
 # This script takes x, y, z data and tries to determine the boundary using alpha shapes.
-# Credit to Kevin Dwyer and Simon Cozens for the custom alpha_shapes function.
+# Credit to Kevin Dwyer and Simon Cozens for the custom alpha_shapes function (now boundary.alpha_shape).
 # https://gist.github.com/dwyerk/10561690
 # https://stackoverflow.com/questions/72418933/find-boundary-points-of-xy-coordinates
 # https://stackoverflow.com/questions/50549128/boundary-enclosing-a-given-set-of-points
 # https://gist.github.com/AndreLester/589ea1eddd3a28d00f3d7e47bd9f28fb
 
-from datetime import datetime
 import matplotlib.pyplot as plt
 import numpy as np
 import shapely.geometry as geometry
-from shapely.ops import cascaded_union, polygonize
-from scipy.spatial import Delaunay
 import fiona
 from sys import exit
 import alphashape
+import point_store
+import boundary
+from cache import Cache
+import instrumentation
 
+point_file = 'bathymetry.npy'  # point store from 'txt_to_npy.py', .npy or compact .npz
 plotting = False  # best not to plot for large data sets as a shapefile is generated and viewable via QGIS more easily
 reduction = True  # add whether a reduction phase is required - use bounds_vis.py & QGIS to determine boundaries first
-mode = 'alphashapes'  # choose 'alphashapes' or 'custom'
+reduction_shapefile = None  # polygons to remove points from (e.g. 'reductionbounds.shp'), None uses rectangles below
+mode = 'alphashapes'  # choose 'alphashapes', 'custom', 'parallel' (custom alpha shape from tiles on every core) or
+# 'raster' (occupancy raster, for very large data sets)
+alpha = 1  # custom mode alpha, None chooses the largest alpha meeting alpha_target
+alpha_sweep = []  # custom mode, alphas to report area, perimeter, parts and holes for, e.g. [0.05, 0.15, 0.5, 1, 2]
+alpha_target = 'single'  # 'single' (one polygon enclosing all points) or 'single_no_holes', used when alpha is None
+tile_size = None  # parallel mode, m, side of the tiles triangulated in parallel, None for about four tiles per worker
+workers = None  # parallel mode, number of processes, None uses every core
+cell_size = 5  # raster mode, m, size of the occupancy raster cells
+closing_radius = 2  # raster mode, cells, gaps up to about twice this wide between survey lines are closed
+max_hole_area = None  # raster mode, m2, holes smaller than this are filled, None fills every hole
+cache_dir = '.cache'  # cache of reduced points and triangulations keyed on their inputs, None to always recompute
+cache_size = 20 * 1024 ** 3  # bytes, least recently used cache entries are deleted beyond this
+trace_file = 'boundary_generation_trace.json'  # per-step time, CPU, memory, IO and item counts (.json or .csv) or None
+profile = False  # also sample the Python stacks, written to trace_file + '.folded' for flame graph tools
 
 # Step 1: Load in data
 
-starttime = datetime.now()  # calculating run times
+trace = instrumentation.Trace('boundary_generation', trace_file, profile=profile)  # records each step and run times
 
-print('Modules imported... (', datetime.now() - starttime, ')')
-
-dt_string = starttime.strftime("%d/%m/%Y %H:%M:%S")
+dt_string = trace.started.strftime("%d/%m/%Y %H:%M:%S")
 print("Simulation start: ", dt_string, '\n')
 
+cache = Cache(cache_dir, cache_size) if cache_dir is not None else None
+
 if reduction is True:
-    data = np.load('bathymetry.npy')
-    print('Bathymetry data loaded... (', datetime.now() - starttime, ')')
-    print('Original number of points = ', len(data[:, 0]))
-    Coords = data[:, :-1]
+    x, y, _ = point_store.load_points(point_file)  # memory-mapped, elevation data not read
+    trace.step('load', 'Bathymetry data loaded', items=len(x))
+    print('Original number of points = ', len(x))
 else:
-    data = np.load('bathymetry_reduced.npy')
-
-    Coords = data[:, :-1]  # remove final column i.e. elevation data
+    x, y = point_store.load_points('bathymetry_reduced.npy')[:2]  # reduced store holds x and y only
 
-    if plotting is True:
-        x, y = Coords[:, 0], Coords[:, 1]
-    else:
-        x, y = 0, 0
+    Coords = np.column_stack((x, y))
+    data = Coords
 
-print('Elevation data dropped... (', datetime.now() - starttime, ')')
+trace.step('drop_elevation', 'Elevation data dropped', items=len(x))
 
 
 # Step 2: Remove redundant data prior to boundary determination
 
 if reduction is True:
-    # Define rectangular (for simplicity) bounds (can enter more than one) to remove data from
-    left = [489400, 490325, 492741, 489875, 489762, 491160, 490555, 494525]
-    bottom = [6502383, 6501252, 6502346, 6503269, 6501898, 6502415, 6501020, 6501590]
-    right = [491160, 494525, 494385, 490960, 490325, 491555, 492370, 494760]
-    top = [6503269, 6502415, 6503055, 6503585, 6502383, 6502810, 6501252, 6502435]
-    Coords_x = []
-    Coords_y = []
-
-    for coordinate in Coords:
-        if right[0] >= coordinate[0] >= left[0] and top[0] >= coordinate[1] >= bottom[0]:
-            pass
-        elif right[1] >= coordinate[0] >= left[1] and top[1] >= coordinate[1] >= bottom[1]:
-            pass
-        elif right[2] >= coordinate[0] >= left[2] and top[2] >= coordinate[1] >= bottom[2]:
-            pass
-        elif right[3] >= coordinate[0] >= left[3] and top[3] >= coordinate[1] >= bottom[3]:
-            pass
-        elif right[4] >= coordinate[0] >= left[4] and top[4] >= coordinate[1] >= bottom[4]:
-            pass
-        elif right[5] >= coordinate[0] >= left[5] and top[5] >= coordinate[1] >= bottom[5]:
-            pass
-        elif right[6] >= coordinate[0] >= left[6] and top[6] >= coordinate[1] >= bottom[6]:
-            pass
-        elif right[7] >= coordinate[0] >= left[7] and top[7] >= coordinate[1] >= bottom[7]:
-            pass
-        else:
-            Coords_x.append(coordinate[0])
-            Coords_y.append(coordinate[1])
-    Coords_ = np.array([Coords_x, Coords_y]).T
+    # Define rectangular (for simplicity) bounds (can enter more than one) to remove data from, or read any polygons
+    # from a shapefile instead, e.g. the 'reductionbounds.shp' written by test_files/bounds_vis.py
+    if reduction_shapefile is None:
+        left = [489400, 490325, 492741, 489875, 489762, 491160, 490555, 494525]
+        bottom = [6502383, 6501252, 6502346, 6503269, 6501898, 6502415, 6501020, 6501590]
+        right = [491160, 494525, 494385, 490960, 490325, 491555, 492370, 494760]
+        top = [6503269, 6502415, 6503055, 6503585, 6502383, 6502810, 6501252, 6502435]
+        regions = boundary.rectangles_to_regions(left, bottom, right, top)
+    else:
+        regions = boundary.read_regions(reduction_shapefile)
+
+    # Classify points in chunks with boolean masks over a lookup grid of the regions and stream the kept points to disk
+    if cache is None:
+        boundary.reduce_points(x, y, regions, 'bathymetry_reduced.npy')
+    else:
+        # the reduced points only depend on the point store and the regions, reuse them when neither changed
+        key = cache.key('reduce_points', [cache.file_digest(path) for path in point_store.store_files(point_file)],
+                        [region.wkb for region in regions])
+        if cache.copy_to(key, 'bathymetry_reduced.npy', lambda path: boundary.reduce_points(x, y, regions, path)):
+            print('Reduced points copied from the cache')
+    Coords_ = point_store.open_store('bathymetry_reduced.npy')
+    kept = len(Coords_)
     data = Coords_
-    np.save('bathymetry_reduced.npy', data)
-    print('Redundant data removed... (', datetime.now() - starttime, ')')
-    print('Reduced number of points = ', len(Coords_x))
+    trace.step('reduce', 'Redundant data removed', items=len(x))
+    print('Reduced number of points = ', kept)
     if plotting is True:
         x_, y_ = Coords_[:, 0], Coords_[:, 1]
         plt.plot(x, y, 'o', color='black', markersize=4)
@@ -95,70 +98,60 @@ if reduction is True:
 
 # Step 3: Determine boundary
 
-t1 = datetime.now()
-
-
-def alpha_shape(points, alpha):
-    """
-    Compute the alpha shape (concave hull) of a set of points.
-    points: Iterable container of points.
-    alpha: alpha value to influence the gooeyness of the border.
-    Smaller numbers on't fall inward as much as larger numbers.
-    Too large, and you lose everything!
-    """
-    if len(points) < 4:
-        # When you have a triangle, there is no sense
-        # in computing an alpha shape.
-        return geometry.MultiPoint(list(points)).convex_hull
-
-    # coords = np.array([point.coords[0] for point in points])
-    # tri = Delaunay(coords)
-    tri = Delaunay(points)
-    triangles = points[tri.vertices]
-    a = ((triangles[:, 0, 0] - triangles[:, 1, 0]) ** 2 + (triangles[:, 0, 1] - triangles[:, 1, 1]) ** 2) ** 0.5
-    b = ((triangles[:, 1, 0] - triangles[:, 2, 0]) ** 2 + (triangles[:, 1, 1] - triangles[:, 2, 1]) ** 2) ** 0.5
-    c = ((triangles[:, 2, 0] - triangles[:, 0, 0]) ** 2 + (triangles[:, 2, 1] - triangles[:, 0, 1]) ** 2) ** 0.5
-    s = (a + b + c) / 2.0
-    areas = (s*(s-a)*(s-b)*(s-c)) ** 0.5
-    circums = a * b * c / (4.0 * areas)
-    filtered = triangles[circums < (1.0 / alpha)]
-    edge1 = filtered[:, (0, 1)]
-    edge2 = filtered[:, (1, 2)]
-    edge3 = filtered[:, (2, 0)]
-    edge_points = np.unique(np.concatenate((edge1, edge2, edge3)), axis=0).tolist()
-    m = geometry.MultiLineString(edge_points)
-    triangles = list(polygonize(m))
-    return cascaded_union(triangles), edge_points
-
-
-print('Generating boundary... (', datetime.now() - starttime, ')')
+t1 = trace.elapsed()
 
 if mode == 'custom':
-    Boundary, edgepoints = alpha_shape(data, alpha=1)
+    # Triangulate once, then every alpha below only filters the triangles sorted by circumradius. Boundary edges are
+    # found by counting edge use over the kept triangles and chained into rings with NumPy
+    key = cache.key('triangulate', cache.file_digest('bathymetry_reduced.npy')) if cache is not None else None
+    cached = cache.get(key, '.npz') if cache is not None else None
+    if cached is not None:
+        # the same points were triangulated before, e.g. in a run with another alpha
+        sweep = boundary.AlphaSweep.load(cached)
+    else:
+        sweep = boundary.AlphaSweep(data)
+        if cache is not None:
+            cache.put(key, sweep.save, '.npz')
+    trace.step('triangulate', 'Triangulation cached', items=len(data))
+    for summary in sweep.sweep(alpha_sweep):
+        print('alpha = %(alpha)g: area = %(area).1f m2, perimeter = %(perimeter).1f m, parts = %(parts)d, '
+              'holes = %(holes)d, points covered = %(covered).1f%%' % dict(summary, covered=100 * summary['covered']))
+    if alpha is None:
+        alpha = sweep.auto_alpha(alpha_target)
+        print('Chosen alpha = ', alpha)
+    Boundary = sweep.shape(alpha)
+elif mode == 'parallel':
+    # Triangulate overlapping tiles on a process pool, keep the triangles centred in each tile and merge the tiles'
+    # boundary edges, giving the same shape as the custom mode without one single-core global triangulation
+    if alpha is None:
+        raise ValueError("Set alpha for the parallel mode, or use the custom mode to choose it automatically")
+    Boundary = boundary.parallel_alpha_shape(data, alpha, tile_size=tile_size, workers=workers)
 elif mode == 'alphashapes':
     Boundary = alphashape.alphashape(data, alpha=0.15)
+elif mode == 'raster':
+    # Bin the points into an occupancy raster in one streaming pass, close gaps, fill holes and outline the cells
+    Boundary = boundary.raster_boundary(data[:, 0], data[:, 1], cell_size, closing_radius, max_hole_area)
 else:
     Boundary = 0
     print('Choose a mode!')
     exit(0)
 
-print('Boundary generated... (', datetime.now() - starttime, ')')
+trace.step('boundary', 'Boundary generated', items=len(data))
 
-t2 = datetime.now()
+t2 = trace.elapsed()
 
 print('Boundary generation time:', t2-t1, 's')
 
 # Step 4: Write shapefile to act ask mask to clip interpolated data
 
-print('Writing polygon shapefile... (', datetime.now() - starttime, ')')
-
 # Define a polygon feature geometry with one attribute
 schema = {'geometry': 'Polygon', 'properties': {'id': 'int'}}
 
 # Write a new Shapefile
 with fiona.open('boundary.shp', 'w', 'ESRI Shapefile', schema, crs='epsg:32630') as output:
     output.write({'geometry': geometry.mapping(Boundary), 'properties': {'id': 0}})
+trace.step('write_shapefile')
 
-simulationtime = datetime.now() - starttime  # calculate simulation time
+simulationtime = trace.close()  # calculate simulation time and write the trace
 
 print('Shapefile written, total conversion process time = ', simulationtime)
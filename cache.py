@@ -0,0 +1,142 @@
+# Filename: 'cache.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module caches the intermediate files of the pipeline (parsed point stores, reduced points, tile indexes,
+# triangulations and gridded tiles) so that a rerun only recomputes the stages whose inputs changed. Each entry is
+# stored under a SHA-256 key of the input data and the parameters that produced it, so a changed input or parameter
+# simply misses the cache. Input files are hashed by content once and the digest is remembered against the file's
+# size and modification time. The cache has a size limit, when it is exceeded the least recently used entries are
+# deleted first.
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+DIGEST_CHUNK = 16 * 1024 ** 2  # bytes hashed at a time
+
+
+class Cache:
+    """
+    Directory of cached files keyed by content hashes, with least recently used eviction.
+    root: cache directory, created when needed.
+    max_bytes: total size of the cached files above which the least recently used are deleted.
+    """
+
+    def __init__(self, root='.cache', max_bytes=20 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total = None  # bytes in the cache, counted on the first write and then kept up to date
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+    def key(self, *parts):
+        """
+        Return the SHA-256 key of some parameters, e.g. file digests, numbers, strings and arrays.
+        """
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                h.update(str((part.dtype.str, part.shape)).encode())
+                h.update(np.ascontiguousarray(part).tobytes())
+            else:
+                h.update(repr(part).encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def file_digest(self, path):
+        """
+        Return the SHA-256 digest of a file's content, reusing the digest while its size and modification time match.
+        """
+        digests_path = os.path.join(self.root, 'digests.json')
+        try:
+            with open(digests_path) as fh:
+                digests = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            digests = {}
+        stat = os.stat(path)
+        name = os.path.abspath(path)
+        if name in digests and digests[name][:2] == [stat.st_size, stat.st_mtime_ns]:
+            return digests[name][2]
+
+        h = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(DIGEST_CHUNK), b''):
+                h.update(block)
+        digests[name] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+        with open(digests_path + '.tmp', 'w') as fh:
+            json.dump(digests, fh)
+        os.replace(digests_path + '.tmp', digests_path)
+        return digests[name][2]
+
+    def path(self, key, suffix='.npy'):
+        """
+        Return the path an entry is stored at.
+        """
+        return os.path.join(self.root, 'objects', key[:2], key + suffix)
+
+    def get(self, key, suffix='.npy'):
+        """
+        Return the path of a cached entry and mark it as used, or None when it is not cached.
+        """
+        path = self.path(key, suffix)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # the modification time records the last use
+        return path
+
+    def put(self, key, write, suffix='.npy'):
+        """
+        Create an entry by calling write(path) on a temporary path, then evict old entries, returning the entry's path.
+        write: function writing the entry to the path it is given (which already ends in suffix).
+        """
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path[:-len(suffix)] + '.tmp' + suffix if suffix else path + '.tmp'
+        write(tmp)
+        os.replace(tmp, path)  # readers only ever see complete entries
+        if self.total is None:
+            self.evict(keep=path)
+        else:
+            self.total += os.path.getsize(path)
+            if self.total > self.max_bytes:
+                self.evict(keep=path)
+        return path
+
+    def fetch(self, key, write, suffix='.npy'):
+        """
+        Return the path of a cached entry, creating it with write(path) first when it is not cached.
+        """
+        path = self.get(key, suffix)
+        return path if path is not None else self.put(key, write, suffix)
+
+    def copy_to(self, key, target, write, suffix='.npy'):
+        """
+        Copy a cached entry to target (creating the entry from write(path) when it is not cached), returning whether
+        it was already cached. Entries are copied rather than linked, so changing target never changes the cache.
+        """
+        cached = self.get(key, suffix)
+        shutil.copyfile(cached if cached is not None else self.put(key, write, suffix), target)
+        return cached is not None
+
+    def evict(self, keep=None):
+        """
+        Delete the least recently used entries until the cache is within max_bytes.
+        keep: path of an entry that is never deleted, e.g. the one just written.
+        """
+        entries = []
+        for folder, _, files in os.walk(os.path.join(self.root, 'objects')):
+            for name in files:
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+        self.total = total
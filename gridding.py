@@ -0,0 +1,476 @@
+# Filename: 'gridding.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module interpolates scattered x, y, z points onto a regular grid tile by tile. Each tile is interpolated only
+# from the points that fall inside it plus a surrounding halo, and is written straight into the output variable, so
+# the full meshgrid is never built and peak memory is set by the tile size rather than the grid size.
+# For nearest neighbour gridding a single KD-tree is built over all points and queried one tile of grid nodes at a
+# time on every core, with an optional distance cap beyond which grid nodes are left as NaN. The same tree gives the
+# distance from every grid node to the nearest point, which can be stored and used to blank nodes far from the data.
+# When the grid is much coarser than the survey, points can instead be binned into the cell around each grid node
+# and summarised per cell (mean, median, min, max, count, std) in a single linear pass over the points.
+# Smooth surfaces use a local radial basis function fitted per overlapping tile in a process pool, with the tiles
+# blended across their seams by weights that taper to zero over the overlap.
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator, griddata
+from scipy.spatial import QhullError, cKDTree
+
+import instrumentation
+from point_store import TileIndex
+
+
+def tile_slices(n, tile_size):
+    """
+    Split n grid nodes into consecutive slices of at most tile_size nodes.
+    """
+    return [slice(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+
+def grid_tiled(x, y, z, xi, yi, out, method='nearest', tile_size=1024, halo=10.0, preprocess=None, index=None,
+               tiles=None, max_distance=None, cache=None, cache_key=None):
+    """
+    Interpolate points onto the grid (yi, xi) tile by tile, writing each tile into out[y, x].
+    Grid nodes with no points within the halo of their tile are set to NaN.
+    x, y, z: point coordinates and values (may be memory-mapped).
+    xi, yi: 1D grid coordinates.
+    out: array-like of shape (yi.size, xi.size), e.g. a NetCDF variable, written one tile at a time.
+    method: griddata interpolation method, 'nearest', 'linear' or 'cubic'.
+    tile_size: number of grid nodes along each side of a tile.
+    halo: distance in metres around a tile from which points are also used.
+    preprocess: optional function applied to the values of each tile's points, e.g. to mask land points.
+    index: optional TileIndex of the points, built here when not given.
+    tiles: optional ids (ty * ntx + tx) of the only tiles to grid, e.g. those near new points, None grids them all.
+    max_distance: grid nodes further than this (in metres, at most halo) from every point are set to NaN.
+    cache: optional Cache the interpolated tiles are stored in and read back from on later runs.
+    cache_key: key of everything the tiles depend on (points, grid, method, halo, preprocess), used with cache.
+    """
+    if max_distance is not None and max_distance > halo:
+        raise ValueError('max_distance (%g m) cannot be larger than the halo (%g m)' % (max_distance, halo))
+    x_tiles, y_tiles = tile_slices(xi.size, tile_size), tile_slices(yi.size, tile_size)
+    if index is None:
+        resolution = xi[1] - xi[0] if xi.size > 1 else 1.0
+        index = TileIndex.build(x, y, xi[0], yi[0], tile_size * resolution, len(x_tiles), len(y_tiles))
+    if tiles is None:
+        tiles = range(len(x_tiles) * len(y_tiles))
+
+    for tile in tiles:
+        ys, xs = y_tiles[tile // len(x_tiles)], x_tiles[tile % len(x_tiles)]
+        if cache is not None:
+            tile_key = cache.key(cache_key, int(tile), max_distance)
+            cached = cache.get(tile_key)
+            if cached is not None:
+                with instrumentation.hot('netcdf_write', (ys.stop - ys.start) * (xs.stop - xs.start)):
+                    out[ys, xs] = np.load(cached)
+                continue
+        gx, gy = xi[xs], yi[ys]
+        bounds = (gx[0] - halo, gx[-1] + halo, gy[0] - halo, gy[-1] + halo)
+        idx = index.window(x, y, *bounds)
+        dist = None
+        if method == 'nearest' and len(idx):
+            values, dist = nearest_tile(x, y, z, idx, gx, gy, bounds, index, preprocess)
+        else:
+            px, py = x[idx], y[idx]
+            values = interpolate_tile(px, py, z[idx] if preprocess is None else preprocess(z[idx]), gx, gy, method)
+        if max_distance is not None and len(idx):
+            if dist is None:
+                # every point within max_distance of the tile is inside its halo, so the tile's points are enough
+                nodes = np.meshgrid(gx, gy)
+                dist, _ = cKDTree(np.column_stack((px, py))).query(np.column_stack((nodes[0].ravel(),
+                                                                                    nodes[1].ravel())),
+                                                                   distance_upper_bound=max_distance)
+            values[dist.reshape(values.shape) > max_distance] = np.nan
+        with instrumentation.hot('netcdf_write', values.size):
+            out[ys, xs] = values
+        if cache is not None:
+            cache.put(tile_key, lambda path: np.save(path, values.astype(np.float32)))
+
+
+def nearest_tile(x, y, z, idx, gx, gy, bounds, index, preprocess=None):
+    """
+    Nearest neighbour interpolation of one tile from the points in the window around it, returning the values and the
+    distances to the nearest points, both of shape (gy.size, gx.size). A node further from its nearest point in the
+    window than from the window's edge may have a nearer point outside it, so those nodes are queried again over the
+    window grown by that distance, giving the same nearest points as a search over all points.
+    x, y, z: point coordinates and values (may be memory-mapped).
+    idx: rows of the points in the window, e.g. from TileIndex.window.
+    gx, gy: 1D grid coordinates of the tile.
+    bounds: (xmin, xmax, ymin, ymax) of the window.
+    index: TileIndex of the points, used to read the grown window.
+    preprocess: optional function applied to the values of the nearest points, e.g. to mask land points.
+    """
+    qx, qy = (node.ravel() for node in np.meshgrid(gx, gy))
+    with instrumentation.hot('griddata', len(idx)):
+        dist, nearest = cKDTree(np.column_stack((x[idx], y[idx]))).query(np.column_stack((qx, qy)))
+    rows = idx[nearest]
+    xmin, xmax, ymin, ymax = bounds
+    far = dist > np.minimum(np.minimum(qx - xmin, xmax - qx), np.minimum(qy - ymin, ymax - qy))
+    if far.any():
+        reach = dist[far]
+        wide = index.window(x, y, (qx[far] - reach).min(), (qx[far] + reach).max(), (qy[far] - reach).min(),
+                            (qy[far] + reach).max())
+        with instrumentation.hot('griddata', len(wide)):
+            dist[far], nearest = cKDTree(np.column_stack((x[wide], y[wide]))).query(np.column_stack((qx[far],
+                                                                                                  qy[far])))
+        rows[far] = wide[nearest]
+    # read each nearest point once, in file order, from the (possibly memory-mapped) values
+    unique, inverse = np.unique(rows, return_inverse=True)
+    values = z[unique] if preprocess is None else preprocess(z[unique])
+    return values[inverse].reshape(gy.size, gx.size), dist.reshape(gy.size, gx.size)
+
+
+def interpolate_tile(px, py, pz, gx, gy, method='nearest'):
+    """
+    Interpolate points onto one tile, returning an array of shape (gy.size, gx.size).
+    """
+    if len(px) == 0:
+        return np.full((gy.size, gx.size), np.nan)
+    try:
+        with instrumentation.hot('griddata', len(px)):
+            return griddata((px, py), pz, (gx[np.newaxis, :], gy[:, np.newaxis]), method=method)
+    except QhullError:
+        # too few (or collinear) points in the tile to triangulate
+        return np.full((gy.size, gx.size), np.nan)
+
+
+def build_tree(x, y):
+    """
+    Build a KD-tree over the points x, y.
+    """
+    # an unbalanced tree without compacted nodes builds much faster and queries about as fast for survey data
+    return cKDTree(np.column_stack((x, y)), balanced_tree=False, compact_nodes=False)
+
+
+def grid_nearest(x, y, z, xi, yi, out, tile_size=1024, max_distance=None, preprocess=None, tree=None, workers=-1):
+    """
+    Nearest neighbour gridding with one KD-tree, querying one tile of grid nodes at a time and writing it to out[y, x].
+    x, y, z: point coordinates and values (may be memory-mapped).
+    xi, yi: 1D grid coordinates.
+    out: array-like of shape (yi.size, xi.size), e.g. a NetCDF variable, written one tile at a time.
+    tile_size: number of grid nodes along each side of a tile.
+    max_distance: grid nodes further than this (in metres) from every point are set to NaN, None disables the cap.
+    preprocess: optional function applied to the values of each tile's nearest points, e.g. to mask land points.
+    tree: optional KD-tree of the points, built here when not given.
+    workers: number of threads used for each query, -1 uses every core.
+    """
+    if tree is None:
+        tree = build_tree(x, y)
+    upper_bound = np.inf if max_distance is None else max_distance
+
+    for ys in tile_slices(yi.size, tile_size):
+        for xs in tile_slices(xi.size, tile_size):
+            gx, gy = np.meshgrid(xi[xs], yi[ys])  # one tile only, already in (y, x) order
+            _, nearest = tree.query(np.column_stack((gx.ravel(), gy.ravel())), distance_upper_bound=upper_bound,
+                                    workers=workers)
+            found = nearest < tree.n  # missing neighbours are returned with index n
+            # read each neighbour once, in file order, from the (possibly memory-mapped) values
+            unique, inverse = np.unique(nearest[found], return_inverse=True)
+            picked = z[unique] if preprocess is None else preprocess(z[unique])
+            values = np.full(nearest.shape, np.nan)
+            values[found] = picked[inverse]
+            with instrumentation.hot('netcdf_write', values.size):
+                out[ys, xs] = values.reshape(gx.shape)
+
+
+def mask_distance(x, y, xi, yi, outputs=(), max_distance=None, distance=None, tile_size=1024, tree=None,
+                  workers=-1):
+    """
+    Find the distance from every grid node to its nearest point one tile at a time, setting the nodes of each float
+    output further than max_distance from every point to NaN and optionally writing the distances out.
+    x, y: point coordinates (may be memory-mapped).
+    xi, yi: 1D grid coordinates.
+    outputs: array-likes of shape (yi.size, xi.size) already gridded, e.g. NetCDF variables, masked in place.
+    max_distance: distance in metres beyond which grid nodes are set to NaN, None only computes the distances.
+    distance: optional array-like of shape (yi.size, xi.size) the distances are written to.
+    tile_size: number of grid nodes along each side of a tile.
+    tree: optional KD-tree of the points, built here when not given.
+    workers: number of threads used for each query, -1 uses every core.
+    """
+    if tree is None:
+        tree = build_tree(x, y)
+    # without a distance output the query can stop at max_distance, so far nodes return inf quickly
+    upper_bound = np.inf if distance is not None or max_distance is None else max_distance
+    outputs = [out for out in outputs if np.issubdtype(out.dtype, np.floating)]  # e.g. counts cannot hold NaN
+
+    for ys in tile_slices(yi.size, tile_size):
+        for xs in tile_slices(xi.size, tile_size):
+            gx, gy = np.meshgrid(xi[xs], yi[ys])
+            dist, _ = tree.query(np.column_stack((gx.ravel(), gy.ravel())), distance_upper_bound=upper_bound,
+                                 workers=workers)
+            dist = dist.reshape(gx.shape)
+            if distance is not None:
+                with instrumentation.hot('netcdf_write', dist.size):
+                    distance[ys, xs] = dist
+            if max_distance is None:
+                continue
+            far = dist > max_distance
+            if far.any():
+                # only tiles with far nodes are read back and rewritten
+                for out in outputs:
+                    values = np.ma.filled(out[ys, xs], np.nan).astype(np.float64)
+                    values[far] = np.nan
+                    with instrumentation.hot('netcdf_write', values.size):
+                        out[ys, xs] = values
+
+
+BIN_STATISTICS = ('mean', 'median', 'min', 'max', 'count', 'std')
+
+
+def bin_points(x, y, z, xi, yi, statistics=('mean',), preprocess=None, chunk_rows=4 * 1024 ** 2):
+    """
+    Summarise the points falling in the cell around each grid node, returning {statistic: array of (yi.size, xi.size)}.
+    Points are read chunk_rows at a time and each chunk is reduced over the cells it touches, then folded into running
+    per-cell totals, so the cost of a chunk does not depend on the size of the grid. Only the median needs every value
+    at once (O(n) extra memory). Points with NaN values are ignored and cells without points are NaN (count 0).
+    x, y, z: point coordinates and values (may be memory-mapped).
+    xi, yi: 1D, evenly spaced grid coordinates.
+    statistics: any of 'mean', 'median', 'min', 'max', 'count' and 'std'.
+    preprocess: optional function applied to the values of each chunk, e.g. to mask land points.
+    chunk_rows: number of points read at a time.
+    """
+    unknown = set(statistics) - set(BIN_STATISTICS)
+    if unknown:
+        raise ValueError('Unknown statistics %s, choose from %s' % (sorted(unknown), BIN_STATISTICS))
+    ncells = xi.size * yi.size
+    resolution = xi[1] - xi[0] if xi.size > 1 else 1.0
+
+    count = np.zeros(ncells, dtype=np.int64)
+    mean = np.zeros(ncells)
+    m2 = np.zeros(ncells)  # sum of squared deviations from the mean
+    low = np.full(ncells, np.inf)
+    high = np.full(ncells, -np.inf)
+    median_cells, median_values = [], []
+
+    for start in range(0, len(x), chunk_rows):
+        values = np.asarray(z[start:start + chunk_rows], dtype=np.float64)
+        values = values if preprocess is None else preprocess(values)
+        ix = np.floor((x[start:start + chunk_rows] - xi[0]) / resolution + 0.5).astype(np.int64)
+        iy = np.floor((y[start:start + chunk_rows] - yi[0]) / resolution + 0.5).astype(np.int64)
+        valid = ~np.isnan(values) & (ix >= 0) & (ix < xi.size) & (iy >= 0) & (iy < yi.size)
+        cells, values = iy[valid] * xi.size + ix[valid], values[valid]
+
+        if cells.size == 0:
+            continue
+
+        # reduce the chunk over the cells it touches only, sorted so each cell's values are one run
+        order = np.argsort(cells, kind='stable')
+        cells, values = cells[order], values[order]
+        starts = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1])))
+        touched = cells[starts]
+        chunk_count = np.diff(np.append(starts, cells.size))
+        chunk_mean = np.add.reduceat(values, starts) / chunk_count
+        chunk_m2 = np.add.reduceat((values - np.repeat(chunk_mean, chunk_count)) ** 2, starts)
+
+        # fold the chunk's per-cell count, mean and squared deviations into the running totals (Chan et al.)
+        before = count[touched]
+        total = before + chunk_count
+        delta = chunk_mean - mean[touched]
+        m2[touched] += chunk_m2 + delta ** 2 * before * chunk_count / total
+        mean[touched] += delta * chunk_count / total
+        count[touched] = total
+
+        low[touched] = np.minimum(low[touched], np.minimum.reduceat(values, starts))
+        high[touched] = np.maximum(high[touched], np.maximum.reduceat(values, starts))
+        if 'median' in statistics:
+            median_cells.append(cells)
+            median_values.append(values)
+
+    empty = count == 0
+    results = {}
+    for statistic in statistics:
+        if statistic == 'count':
+            results[statistic] = count.reshape(yi.size, xi.size)
+            continue
+        if statistic == 'mean':
+            grid = mean
+        elif statistic == 'std':
+            grid = np.sqrt(m2 / np.maximum(count, 1))
+        elif statistic == 'min':
+            grid = low
+        elif statistic == 'max':
+            grid = high
+        else:
+            grid = _bin_median(np.concatenate(median_cells), np.concatenate(median_values), ncells)
+        grid = grid.copy()
+        grid[empty] = np.nan
+        results[statistic] = grid.reshape(yi.size, xi.size)
+    return results
+
+
+def _bin_median(cells, values, ncells):
+    order = np.lexsort((values, cells))  # by cell, then by value within each cell
+    cells, values = cells[order], values[order]
+    starts = np.searchsorted(cells, np.arange(ncells))
+    counts = np.bincount(cells, minlength=ncells)
+    median = np.full(ncells, np.nan)
+    full = counts > 0
+    lower = starts[full] + (counts[full] - 1) // 2
+    upper = starts[full] + counts[full] // 2
+    median[full] = (values[lower] + values[upper]) / 2
+    return median
+
+
+def grid_rbf(x, y, z, xi, yi, out, tile_size=1024, overlap=16, halo=10.0, neighbors=10, kernel='thin_plate_spline',
+             smoothing=0.0, preprocess=None, index=None, workers=None):
+    """
+    Local RBF interpolation of overlapping tiles on a process pool, blended across seams and written to out[y, x].
+    Each tile is fitted on its points (plus overlap and halo) and evaluated on the tile grown by overlap nodes. Where
+    tiles overlap the results are averaged with weights that fall linearly to zero towards each tile's outer edge,
+    so there is no visible seam. Grid nodes are written as soon as every tile reaching them is done: only the rows of
+    each seam between two rows of tiles (2 x overlap rows) are held across the grid width, the rest is held for a
+    tile or two, so memory does not grow with the tile rows times the grid width. As in the other grid modes, grid
+    nodes whose nearest point is NaN after preprocess (e.g. land) are NaN, and so are grid nodes further than halo
+    from every valid point.
+    x, y, z: point coordinates and values (may be memory-mapped).
+    xi, yi: 1D grid coordinates.
+    out: array-like of shape (yi.size, xi.size), e.g. a NetCDF variable, written one row of tiles at a time.
+    tile_size: number of grid nodes along each side of a tile.
+    overlap: number of grid nodes each tile is grown by on every side, at most tile_size.
+    halo: distance in metres beyond the grown tile from which points are also used.
+    neighbors, kernel, smoothing: passed to scipy.interpolate.RBFInterpolator.
+    preprocess: optional function applied to the values of each tile's points, points that become NaN are not fitted.
+    index: optional TileIndex of the points, built here when not given.
+    workers: number of worker processes, defaults to the number of cores.
+    """
+    overlap = min(overlap, tile_size)
+    x_tiles, y_tiles = tile_slices(xi.size, tile_size), tile_slices(yi.size, tile_size)
+    if index is None:
+        resolution = xi[1] - xi[0] if xi.size > 1 else 1.0
+        index = TileIndex.build(x, y, xi[0], yi[0], tile_size * resolution, len(x_tiles), len(y_tiles))
+    workers = workers or os.cpu_count()
+    x_grown = [_grow(xs, overlap, xi.size) for xs in x_tiles]
+    y_grown = [_grow(ys, overlap, yi.size) for ys in y_tiles]
+
+    # grid rows reached by more than one row of tiles (the seams, 2 x overlap rows each) are blended across the whole
+    # grid width, the other rows of a row of tiles only get contributions from its own tiles
+    coverage = np.zeros(yi.size, dtype=np.int64)
+    for ey in y_grown:
+        coverage[ey] += 1
+    shared = coverage > 1
+    own_rows = []
+    for ys in y_tiles:
+        rows = np.flatnonzero(~shared[ys]) + ys.start
+        own_rows.append(slice(rows[0], rows[-1] + 1) if len(rows) else slice(ys.start, ys.start))
+
+    def tasks():
+        for r, ys in enumerate(y_tiles):
+            for c, xs in enumerate(x_tiles):
+                ey, ex = y_grown[r], x_grown[c]
+                gx, gy = xi[ex], yi[ey]
+                idx = index.window(x, y, gx[0] - halo, gx[-1] + halo, gy[0] - halo, gy[-1] + halo)
+                pz = z[idx] if preprocess is None else preprocess(z[idx])
+                yield (r, c, ys, xs, ey, ex), (x[idx], y[idx], pz, gx, gy, halo, neighbors, kernel, smoothing)
+
+    seams = {}  # weighted sums and weights of each shared grid row still receiving contributions
+    open_columns = {}  # per row of tiles, first column still receiving contributions and its rows' sums and weights
+
+    def write(rows, columns, num, den):
+        with np.errstate(invalid='ignore', divide='ignore'), instrumentation.hot('netcdf_write', num.size):
+            out[rows, columns] = np.where(den > 0, num / den, np.nan)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        jobs = tasks()
+        done = False
+        while pending or not done:
+            while not done and len(pending) < 2 * workers:  # bound the number of tiles in flight
+                try:
+                    key, task = next(jobs)
+                except StopIteration:
+                    done = True
+                    break
+                pending.append((key, pool.submit(_rbf_tile, task)))
+            if not pending:
+                break
+            (r, c, ys, xs, ey, ex), future = pending.popleft()
+            values = future.result()
+            weights = _blend_weights(ey, ys, overlap)[:, np.newaxis] * _blend_weights(ex, xs, overlap)[np.newaxis, :]
+            weights = np.where(np.isnan(values), 0.0, weights)
+            values = np.nan_to_num(values) * weights
+
+            for i in np.flatnonzero(shared[ey]) + ey.start:
+                num, den = seams.setdefault(i, (np.zeros(xi.size), np.zeros(xi.size)))
+                num[ex] += values[i - ey.start]
+                den[ex] += weights[i - ey.start]
+
+            rows = own_rows[r]
+            if rows.stop > rows.start:
+                # tiles arrive in order along the row, so columns before the next tile's grown start are finished
+                first, num, den = open_columns.pop(r, (ex.start, np.zeros((rows.stop - rows.start, 0)), None))
+                den = num.copy() if den is None else den
+                if ex.stop - first > num.shape[1]:
+                    grow = np.zeros((num.shape[0], ex.stop - first - num.shape[1]))
+                    num, den = np.hstack((num, grow)), np.hstack((den, grow))
+                part = slice(rows.start - ey.start, rows.stop - ey.start)
+                num[:, ex.start - first:ex.stop - first] += values[part]
+                den[:, ex.start - first:ex.stop - first] += weights[part]
+                finished = x_grown[c + 1].start if c + 1 < len(x_tiles) else xi.size
+                if finished > first:
+                    write(rows, slice(first, finished), num[:, :finished - first], den[:, :finished - first])
+                    num, den = num[:, finished - first:], den[:, finished - first:]
+                if finished < xi.size:
+                    open_columns[r] = (finished, num, den)
+
+            if c == len(x_tiles) - 1:
+                # the row of tiles is done, so shared rows before the next row's grown start are finished
+                finished = y_grown[r + 1].start if r + 1 < len(y_tiles) else yi.size
+                ready = sorted(i for i in seams if i < finished)
+                for run in np.split(ready, np.flatnonzero(np.diff(ready) > 1) + 1) if ready else []:
+                    num = np.array([seams[i][0] for i in run])
+                    den = np.array([seams.pop(i)[1] for i in run])
+                    write(slice(run[0], run[-1] + 1), slice(None), num, den)
+
+
+def _grow(tile, overlap, n):
+    return slice(max(tile.start - overlap, 0), min(tile.stop + overlap, n))
+
+
+def _blend_weights(grown, tile, overlap):
+    # weights over the grown tile rising linearly from the outer edge, so two tiles sum to about 1 across a seam
+    nodes = np.arange(grown.start, grown.stop)
+    edge = np.minimum(nodes - (tile.start - overlap), (tile.stop + overlap - 1) - nodes)
+    return np.minimum((edge + 1) / (2 * overlap + 1), 1.0)
+
+
+def _rbf_tile(task):
+    px, py, pz, gx, gy, halo, neighbors, kernel, smoothing = task
+    # fit in coordinates centred on the tile, large UTM offsets make the RBF system poorly conditioned
+    cx, cy = gx.mean(), gy.mean()
+    gxx, gyy = np.meshgrid(gx - cx, gy - cy)
+    nodes = np.column_stack((gxx.ravel(), gyy.ravel()))
+    valid = ~np.isnan(pz)
+    if valid.sum() < 3:
+        return np.full(gxx.shape, np.nan)
+    # grid nodes nearest a NaN point (e.g. land) stay NaN as in the nearest grid modes, rather than be extrapolated
+    _, nearest = cKDTree(np.column_stack((px - cx, py - cy))).query(nodes)
+    blank = ~valid[nearest]
+    px, py, pz = px[valid], py[valid], pz[valid]
+    # soundings at the same position (e.g. where survey lines overlap) make the local system singular, average them
+    points, inverse = np.unique(np.column_stack((px, py)), axis=0, return_inverse=True)
+    if len(points) < len(pz):
+        inverse = inverse.ravel()
+        px, py, pz = points[:, 0], points[:, 1], np.bincount(inverse, weights=pz) / np.bincount(inverse)
+    if len(pz) < 3:
+        return np.full(gxx.shape, np.nan)
+    centred = np.column_stack((px - cx, py - cy))
+    distance, nearest = cKDTree(centred).query(nodes, distance_upper_bound=halo)
+    blank |= np.isinf(distance)  # no valid point within halo
+    values = None
+    for attempt in (smoothing, max(10 * smoothing, 1e-3)):
+        try:
+            rbf = RBFInterpolator(centred, pz, neighbors=min(neighbors, len(pz)), kernel=kernel, smoothing=attempt)
+            values = rbf(nodes)
+            break
+        except (np.linalg.LinAlgError, ValueError):
+            # nearly coincident or collinear points leave the local system singular, retry with a little smoothing
+            continue
+    if values is None:
+        # still singular (e.g. every point on one line), fill the tile from the nearest points rather than leave a hole
+        values = pz[np.minimum(nearest, len(pz) - 1)]
+    values[blank] = np.nan
+    return values.reshape(gxx.shape)
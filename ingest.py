@@ -0,0 +1,353 @@
+# Filename: 'ingest.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module parses delimited x, y, z text files into .npy point stores without holding the whole file in memory.
+# The file is read in fixed-size byte chunks cut on line endings, each chunk is parsed straight to a numeric block
+# and the block is appended to the output .npy, so peak memory depends on the chunk size rather than the file size.
+# Large files can also be split on line endings into byte ranges that are parsed in parallel by a process pool, each
+# worker writing its rows into its own slice of one memory-mapped output array.
+# Tiled surveys made of many (optionally gzip, xz or bz2 compressed) files are decompressed as streams and concatenated
+# into one point store, with the next few files read and parsed in background threads to hide decompression latency.
+
+import bz2
+import glob
+import gzip
+import lzma
+import os
+import queue
+import struct
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+NPY_HEADER_LENGTH = 128  # fixed .npy header size so the row count can be rewritten once the file is complete
+
+
+def iter_line_chunks(fh, chunk_size, length=None):
+    """
+    Read a binary file object in blocks of roughly chunk_size bytes, each cut after the last complete line.
+    fh: binary file object positioned after any header rows.
+    chunk_size: number of bytes to read per block.
+    length: number of bytes to read in total, None reads to the end of the file.
+    """
+    remainder = b''
+    while True:
+        if length is None:
+            block = fh.read(chunk_size)
+        else:
+            block = fh.read(min(chunk_size, length))
+            length -= len(block)
+        if not block:
+            break
+        block = remainder + block
+        cut = block.rfind(b'\n') + 1
+        if cut == 0:
+            # no line ending yet, keep reading until a full line is available
+            remainder = block
+            continue
+        remainder = block[cut:]
+        yield block[:cut]
+    if remainder.strip():
+        yield remainder
+
+
+def _per_line(data, mask):
+    # count the bytes of data (bytes) selected by mask on each line, a final line may lack its line ending
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw == ord('\n'))
+    if raw.size and raw[-1] != ord('\n'):
+        ends = np.append(ends, raw.size)
+    return np.diff(np.searchsorted(np.flatnonzero(mask(raw)), ends), prepend=0)
+
+
+def _field_starts(raw):
+    # first byte of each run of bytes other than whitespace and control characters
+    filled = raw > ord(' ')
+    filled[1:] &= ~filled[:-1]
+    return filled
+
+
+def count_lines(block):
+    """
+    Count the lines of a block of text holding more than whitespace, i.e. the rows parse_block returns for it.
+    block: bytes containing whole lines only.
+    """
+    return int(np.count_nonzero(_per_line(block, _field_starts)))
+
+
+def parse_block(block, ncols=3, delimiter=','):
+    """
+    Parse a block of complete delimited text lines into an (n, ncols) float64 array.
+    Lines holding only whitespace are skipped, as by np.loadtxt, and any other line without exactly ncols fields
+    raises a ValueError rather than shifting the values of the following lines, as does an empty field (e.g. '1,,2,3'
+    or a trailing delimiter) rather than shifting the values after it into the wrong columns.
+    block: bytes containing whole lines only.
+    ncols: number of columns per line.
+    delimiter: column delimiter used in the file.
+    """
+    data = block.replace(delimiter.encode(), b' ')
+    fields = _per_line(data, _field_starts)
+    blank = fields == 0
+    if blank.any():
+        blank = _per_line(block, _field_starts) == 0  # a line of delimiters only is not blank
+    bad = np.flatnonzero((fields != ncols) & ~blank)
+    if len(bad):
+        raise ValueError('Line %d of block starting with %r has %d columns, not %d'
+                         % (bad[0] + 1, block[:80], fields[bad[0]], ncols))
+    if len(delimiter) == 1 and not delimiter.isspace():
+        # replacing the delimiters by spaces merges empty fields, so check each line has one delimiter per value
+        delimiters = _per_line(block, lambda raw: raw == ord(delimiter))
+        bad = np.flatnonzero((delimiters != ncols - 1) & ~blank)
+        if len(bad):
+            raise ValueError('Line %d of block starting with %r has %d delimiters for %d columns (an empty field?)'
+                             % (bad[0] + 1, block[:80], delimiters[bad[0]], ncols))
+    if blank.all():
+        return np.zeros((0, ncols))  # np.fromstring would return [-1.] for whitespace
+    with warnings.catch_warnings():
+        # older numpy only warns when the text cannot be parsed to its end, treat that as a parsing error
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(data.decode('ascii'), dtype=np.float64, sep=' ')
+        except (DeprecationWarning, ValueError):
+            raise ValueError('Could not parse block starting with %r' % block[:80]) from None
+    if values.size != fields.sum():
+        raise ValueError('Could not parse every value of block starting with %r' % block[:80])
+    return values.reshape(-1, ncols)
+
+
+def write_npy_header(fh, rows, ncols, dtype=np.float64):
+    """
+    Write a fixed-length .npy header at the start of fh, so it can be overwritten once the row count is known.
+    fh: binary file object opened for writing.
+    rows: number of rows in the array.
+    ncols: number of columns in the array.
+    dtype: data type of the array.
+    """
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d, %d), }" % (np.dtype(dtype).str, rows, ncols)
+    header = header.ljust(NPY_HEADER_LENGTH - 11) + '\n'
+    fh.seek(0)
+    fh.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+
+def stream_txt_to_npy(input_file, output_file, delimiter=',', skiprows=1, ncols=3, chunk_size=64 * 1024 ** 2):
+    """
+    Convert a delimited text file into an .npy file in chunks, returning the number of rows written.
+    input_file: path to the delimited text file.
+    output_file: path of the .npy file to write.
+    delimiter: column delimiter used in the file.
+    skiprows: number of header rows to skip.
+    ncols: number of columns per line.
+    chunk_size: number of bytes read and parsed at a time, which sets the peak memory use.
+    """
+    rows = 0
+    with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+        for _ in range(skiprows):
+            src.readline()
+        write_npy_header(dst, 0, ncols)
+        for block in iter_line_chunks(src, chunk_size):
+            values = parse_block(block, ncols, delimiter)
+            values.tofile(dst)
+            rows += len(values)
+        write_npy_header(dst, rows, ncols)
+    return rows
+
+
+def data_end(fh):
+    """
+    Return the offset just past the last non-whitespace byte of a binary file, so trailing blank lines are ignored.
+    fh: binary file object opened for reading.
+    """
+    pos = fh.seek(0, os.SEEK_END)
+    while pos > 0:
+        step = min(4096, pos)
+        fh.seek(pos - step)
+        stripped = fh.read(step).rstrip()
+        if stripped:
+            return pos - step + len(stripped)
+        pos -= step
+    return 0
+
+
+def line_ranges(input_file, nranges, skiprows=1):
+    """
+    Split the data rows of a text file into byte ranges that start and end on line boundaries.
+    input_file: path to the delimited text file.
+    nranges: number of ranges to aim for, fewer are returned for small files.
+    skiprows: number of header rows to skip.
+    """
+    with open(input_file, 'rb') as fh:
+        for _ in range(skiprows):
+            fh.readline()
+        start = fh.tell()
+        end = data_end(fh)
+        boundaries = [start]
+        for i in range(1, nranges):
+            fh.seek(start + (end - start) * i // nranges)
+            fh.readline()  # move to the start of the next line
+            boundaries.append(min(max(fh.tell(), boundaries[-1]), end))
+        boundaries.append(end)
+    return [(a, b) for a, b in zip(boundaries[:-1], boundaries[1:]) if b > a]
+
+
+def _count_rows(task):
+    input_file, start, end, chunk_size = task
+    rows = 0
+    with open(input_file, 'rb') as fh:
+        fh.seek(start)
+        for block in iter_line_chunks(fh, chunk_size, end - start):
+            rows += count_lines(block)  # blank lines are skipped by parse_block, so they are not rows
+    return rows
+
+
+def _parse_range(task):
+    input_file, output_file, start, end, row_start, row_end, ncols, delimiter, chunk_size = task
+    out = np.load(output_file, mmap_mode='r+')
+    row = row_start
+    with open(input_file, 'rb') as fh:
+        fh.seek(start)
+        for block in iter_line_chunks(fh, chunk_size, end - start):
+            values = parse_block(block, ncols, delimiter)
+            if row + len(values) > row_end:
+                raise ValueError('Byte range %d-%d of %s has more rows than lines' % (start, end, input_file))
+            out[row:row + len(values)] = values
+            row += len(values)
+    out.flush()
+    if row != row_end:
+        raise ValueError('Byte range %d-%d of %s has malformed lines' % (start, end, input_file))
+    return row - row_start
+
+
+def parallel_txt_to_npy(input_file, output_file, delimiter=',', skiprows=1, ncols=3, workers=None,
+                        chunk_size=16 * 1024 ** 2, columnar=False):
+    """
+    Convert a delimited text file into an .npy file using a process pool, returning the number of rows written.
+    Rows are counted per byte range first so every worker knows which slice of the memory-mapped output it owns,
+    which keeps the row order identical to the file and means parsed data is never sent back to this process.
+    input_file: path to the delimited text file.
+    output_file: path of the .npy file to write.
+    delimiter: column delimiter used in the file.
+    skiprows: number of header rows to skip.
+    ncols: number of columns per line.
+    workers: number of worker processes, defaults to the number of cores.
+    chunk_size: number of bytes each worker reads and parses at a time.
+    columnar: write the output column-major so each column is contiguous on disk.
+    """
+    workers = workers or os.cpu_count()
+    ranges = line_ranges(input_file, workers * 4, skiprows)  # several ranges per worker to balance the load
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = list(pool.map(_count_rows, [(input_file, a, b, chunk_size) for a, b in ranges]))
+        offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+
+        out = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.float64, shape=(int(offsets[-1]), ncols),
+                                        fortran_order=columnar)
+        del out  # workers open their own memory maps of the file
+
+        tasks = [(input_file, output_file, a, b, int(offsets[i]), int(offsets[i + 1]), ncols, delimiter, chunk_size)
+                 for i, (a, b) in enumerate(ranges)]
+        rows = sum(pool.map(_parse_range, tasks))
+    return rows
+
+
+def open_survey(path):
+    """
+    Open a survey file for binary reading, decompressing it as a stream when it ends in .gz, .xz, .lzma or .bz2.
+    path: path to the survey file.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith(('.xz', '.lzma')):
+        return lzma.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def resolve_inputs(patterns=(), manifest=None):
+    """
+    List the survey files to ingest, in a fixed order.
+    patterns: glob patterns, the matches of each pattern are sorted by name.
+    manifest: optional text file listing one survey file per line, relative paths are taken from its directory.
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError('No files match %r' % pattern)
+        paths.extend(matches)
+    if manifest is not None:
+        root = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as fh:
+            for line in fh:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(os.path.join(root, line))
+    return paths
+
+
+def _read_survey(path, skiprows, ncols, delimiter, chunk_size, blocks, stats):
+    # runs in a background thread, passing parsed blocks (or the error that stopped it) to the writer through blocks
+    t0 = time.perf_counter()
+    try:
+        with open_survey(path) as fh:
+            for _ in range(skiprows):
+                fh.readline()
+            for block in iter_line_chunks(fh, chunk_size):
+                stats['bytes'] += len(block)
+                blocks.put(parse_block(block, ncols, delimiter))
+    except Exception as error:
+        blocks.put(error)
+    stats['seconds'] = time.perf_counter() - t0
+    blocks.put(None)
+
+
+def ingest_files(paths, output_file, delimiter=',', skiprows=1, ncols=3, readers=4, chunk_size=16 * 1024 ** 2):
+    """
+    Concatenate several (optionally compressed) survey files into one .npy file, returning the number of rows written.
+    Up to readers files are decompressed and parsed ahead in background threads while earlier files are written, and
+    each reader holds at most two parsed chunks, so memory use is set by readers and chunk_size.
+    paths: survey files in the order they are to be stored.
+    output_file: path of the .npy file to write.
+    delimiter: column delimiter used in the files.
+    skiprows: number of header rows to skip in every file.
+    ncols: number of columns per line.
+    readers: number of files read concurrently.
+    chunk_size: number of decompressed bytes parsed at a time.
+    """
+    jobs = []
+
+    def start(path):
+        blocks, stats = queue.Queue(maxsize=2), {'bytes': 0, 'seconds': 0.0}
+        threading.Thread(target=_read_survey, args=(path, skiprows, ncols, delimiter, chunk_size, blocks, stats),
+                         daemon=True).start()
+        jobs.append((path, blocks, stats))
+
+    for path in paths[:readers]:
+        start(path)
+
+    total = 0
+    with open(output_file, 'wb') as dst:
+        write_npy_header(dst, 0, ncols)
+        for i, path in enumerate(paths):
+            path, blocks, stats = jobs[i]
+            rows = 0
+            while True:
+                values = blocks.get()
+                if values is None:
+                    break
+                if isinstance(values, Exception):
+                    raise values
+                values.tofile(dst)
+                rows += len(values)
+            total += rows
+            if i + readers < len(paths):
+                start(paths[i + readers])
+            rate = stats['bytes'] / max(stats['seconds'], 1e-9) / 1024 ** 2
+            print('File %d/%d %s: %d rows, %.1f MB, %.1f MB/s' % (i + 1, len(paths), os.path.basename(path), rows,
+                                                                   stats['bytes'] / 1024 ** 2, rate))
+        write_npy_header(dst, total, ncols)
+    return total
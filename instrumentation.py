@@ -0,0 +1,269 @@
+# Filename: 'instrumentation.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module records what each stage of a run costs, so runs can be compared for regressions and batch nodes sized
+# from real figures. A Trace times named stages (which can be nested as sub-steps) and stores for each one the wall
+# time, CPU time (including finished child processes), peak and final resident memory, bytes read and written and an
+# optional item count, then writes them as a JSON or CSV trace. Peak memory is measured per stage by resetting the
+# kernel's high water mark (/proc/self/clear_refs) when a stage starts, falling back to the peak of the whole process
+# where that is not possible. Library code marks its hot paths (griddata, Delaunay, polygon building and NetCDF
+# writes) with hot(), which adds their time and call count to the running stage and labels the stacks of the optional
+# sampling profiler. The profiler samples the Python stacks of every thread and writes them in the folded format read
+# by flame graph tools. With no trace running hot() does nothing.
+
+import csv
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+_current = None  # the Trace hot() records into, None when no trace is running
+
+FIELDS = ['run', 'stage', 'message', 'start', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rss_mb', 'read_mb',
+          'write_mb', 'disk_read_mb', 'disk_write_mb', 'items', 'items_per_second', 'hot']
+
+
+def _memory():
+    """
+    Return the (current, peak) resident memory of the process in MB.
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            status = dict(line.split(':', 1) for line in fh)
+        return int(status['VmRSS'].split()[0]) / 1024, int(status['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != 'darwin' else 1024 ** 2)
+        return peak, peak
+
+
+def _reset_peak():
+    """
+    Reset the peak resident memory of the process to its current value, returning whether it was possible.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _io():
+    """
+    Return the bytes read and written by the process so far in MB, through read and write calls and from storage
+    (which includes memory-mapped files), as (read, write, disk_read, disk_write). Zeros where unavailable.
+    """
+    try:
+        with open('/proc/self/io') as fh:
+            io = {name: int(value) for name, value in (line.split(':') for line in fh)}
+        return tuple(io[name] / 1024 ** 2 for name in ('rchar', 'wchar', 'read_bytes', 'write_bytes'))
+    except (OSError, KeyError, ValueError):
+        return 0.0, 0.0, 0.0, 0.0
+
+
+def _cpu():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Trace:
+    """
+    Per-stage wall time, CPU time, memory, IO and item counts of one run. CPU time, memory and IO are those of the
+    whole process while a stage ran, so stages running at the same time (e.g. in the pipeline) share them.
+    name: name of the run, e.g. the script, written on every record.
+    path: .json or .csv file the trace is written to by close(), None to only log progress.
+    log: function given a progress message when each stage finishes, None for no messages.
+    profile: sample the Python stacks of every thread while the trace runs, written to path + '.folded'.
+    interval: seconds between profiler samples.
+    """
+
+    def __init__(self, name, path=None, log=print, profile=False, interval=0.01):
+        global _current
+        self.name = name
+        self.path = path
+        self.log = log
+        self.records = []
+        self.open = []  # records of the stages running now, in any thread
+        self.local = threading.local()  # stack of the stages opened by each thread
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.t0 = time.perf_counter()
+        self.per_stage_peak = False  # whether the peak memory of each stage could be measured on its own
+        self.samples = Counter()
+        self.hot_paths = {}  # hot path each thread is in, labels the profiler samples
+        self.sampler = None
+        if profile:
+            self.stop = threading.Event()
+            self.sampler = threading.Thread(target=self._sample, args=(interval,), daemon=True)
+            self.sampler.start()
+        self.pending = self._begin(None)  # the step running now in a script using step()
+        self.outer = _current  # a trace already running, e.g. of a script running a pipeline, restored by close()
+        _current = self
+
+    def elapsed(self):
+        return timedelta(seconds=time.perf_counter() - self.t0)
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def _begin(self, name):
+        record = {'run': self.name, 'stage': name, 'message': None, 'start': time.perf_counter() - self.t0,
+                  'items': None, 'hot': {}}
+        with self.lock:
+            # fold the peak so far into every running stage before the high water mark is reset
+            _, peak = _memory()
+            for other in self.open:
+                other['peak_rss_mb'] = max(other['peak_rss_mb'], peak)
+            self.per_stage_peak = _reset_peak()
+            record['peak_rss_mb'] = _memory()[0] if self.per_stage_peak else peak
+            self.open.append(record)
+        record['_before'] = time.perf_counter(), _cpu(), _io()
+        return record
+
+    def _end(self, record):
+        wall, cpu, io = record.pop('_before')
+        record['wall_seconds'] = time.perf_counter() - wall
+        record['cpu_seconds'] = _cpu() - cpu
+        for field, before, after in zip(['read_mb', 'write_mb', 'disk_read_mb', 'disk_write_mb'], io, _io()):
+            record[field] = after - before
+        with self.lock:
+            record['rss_mb'], peak = _memory()
+            record['peak_rss_mb'] = max(record['peak_rss_mb'], peak)
+            self.open.remove(record)
+        if record['items'] is not None and record['wall_seconds'] > 0:
+            record['items_per_second'] = record['items'] / record['wall_seconds']
+        self.records.append(record)
+        if self.log is not None and record['message'] is not None:
+            self.log('%s... ( %s )' % (record['message'], self.elapsed()))
+
+    @contextmanager
+    def stage(self, name, message=None, items=None):
+        """
+        Time a stage, yielding its record so items (e.g. points or tiles processed) can be set once known.
+        Stages opened inside another stage of the same thread are recorded as sub-steps named 'parent/name'.
+        name: stage name in the trace.
+        message: progress message logged when the stage finishes, None to log nothing.
+        items: number of items the stage processes, if known up front.
+        """
+        stack = self._stack()
+        record = self._begin(stack[-1]['stage'] + '/' + name if stack else name)
+        record['message'], record['items'] = message, items
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            stack.pop()
+            self._end(record)
+
+    def step(self, name, message=None, items=None):
+        """
+        Record everything since the previous step (or the start of the trace) as a stage, for scripts that mark the
+        end of each step rather than wrapping it.
+        name: stage name in the trace.
+        message: progress message logged, None to log nothing.
+        items: number of items the step processed.
+        """
+        record = self.pending
+        record['stage'], record['message'], record['items'] = name, message, items
+        self._end(record)
+        self.pending = self._begin(None)
+
+    def add_hot(self, name, seconds, items):
+        """
+        Add the time and items of one call of a hot path to the innermost stage of this thread, or to the most
+        recently started running stage when this thread (e.g. a pool worker) has none.
+        """
+        stack = self._stack()
+        with self.lock:
+            record = stack[-1] if stack else (self.open[-1] if self.open else None)
+            if record is None:
+                return
+            hot = record['hot'].setdefault(name, {'calls': 0, 'seconds': 0.0, 'items': 0})
+            hot['calls'] += 1
+            hot['seconds'] += seconds
+            hot['items'] += items or 0
+
+    def _sample(self, interval):
+        own = threading.get_ident()
+        names = {}
+        while not self.stop.wait(interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                    frame = frame.f_back
+                if ident in self.hot_paths:
+                    stack.insert(0, '[%s]' % self.hot_paths[ident])
+                self.samples[';'.join([names.get(ident, 'thread')] + stack[::-1])] += 1
+
+    def close(self):
+        """
+        Stop the profiler and write the trace (and the folded profiler stacks), returning the total elapsed time.
+        """
+        global _current
+        if _current is self:
+            _current = self.outer
+        if self.sampler is not None:
+            self.stop.set()
+            self.sampler.join()
+        with self.lock:
+            self.open.remove(self.pending)  # anything after the last step is not recorded
+        total = self.elapsed()
+        records = sorted(self.records, key=lambda r: r['start'])
+        if self.path is not None:
+            if self.path.endswith('.csv'):
+                with open(self.path, 'w', newline='') as fh:
+                    writer = csv.DictWriter(fh, FIELDS, extrasaction='ignore')
+                    writer.writeheader()
+                    for record in records:
+                        writer.writerow(dict(record, hot=json.dumps(record['hot'])))
+            else:
+                with open(self.path, 'w') as fh:
+                    json.dump({'run': self.name, 'started': self.started.isoformat(), 'host': platform.node(),
+                               'cpus': os.cpu_count(), 'per_stage_peak': self.per_stage_peak,
+                               'wall_seconds': total.total_seconds(), 'stages': records}, fh, indent=1)
+            if self.sampler is not None:
+                with open(self.path + '.folded', 'w') as fh:
+                    for stack, count in self.samples.most_common():
+                        fh.write('%s %d\n' % (stack, count))
+        return total
+
+
+@contextmanager
+def hot(name, items=None):
+    """
+    Mark a hot path (e.g. 'griddata', 'delaunay', 'polygonize', 'netcdf_write') so its time and call count are added
+    to the running stage of the current trace. Does nothing when no trace is running.
+    name: name of the hot path.
+    items: number of items (e.g. points or grid nodes) handled by this call.
+    """
+    trace = _current
+    if trace is None:
+        yield
+        return
+    ident = threading.get_ident()
+    outer = trace.hot_paths.get(ident)
+    trace.hot_paths[ident] = name
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_hot(name, time.perf_counter() - t, items)
+        if outer is None:
+            del trace.hot_paths[ident]
+        else:
+            trace.hot_paths[ident] = outer
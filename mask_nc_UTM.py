@@ -0,0 +1,33 @@
+# Filename: 'mask_nc_UTM.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This script clips the gridded NetCDF from 'npy_to_nc_UTM.py' to the boundary shapefile from 'boundary_generation.py',
+# setting every grid node outside the boundary (or inside one of its holes) to NaN.
+
+import instrumentation
+import masking
+
+boundary_file = 'boundary.shp'
+input_file = 'bathymetry_UTM.nc'
+output_file = None  # path of a new masked NetCDF, None masks input_file in place
+tile_size = 1024  # grid nodes along each side of a tile, sets the peak memory use
+trace_file = 'mask_nc_UTM_trace.json'  # per-step time, CPU, peak memory, IO and item counts (.json or .csv), or None
+profile = False  # also sample the Python stacks, written to trace_file + '.folded' for flame graph tools
+
+trace = instrumentation.Trace('mask_nc_UTM', trace_file, profile=profile)  # records each step, calculating run times
+
+dt_string = trace.started.strftime("%d/%m/%Y %H:%M:%S")
+print("Simulation start: ", dt_string, '\n')
+
+Boundary = masking.read_boundary(boundary_file)
+
+trace.step('load_boundary', 'Boundary loaded')
+
+# Rasterize the boundary onto the grid one tile at a time with an even-odd scanline fill and blank the outside
+masking.mask_grid(input_file, Boundary, output=output_file, tile_size=tile_size)
+trace.step('mask')
+
+simulationtime = trace.close()  # calculate simulation time and write the trace
+
+print('NetCDF masked, total masking process time = ', simulationtime)
@@ -0,0 +1,183 @@
+# Filename: 'masking.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module clips a gridded NetCDF to a boundary polygon (e.g. 'boundary.shp'), setting the grid nodes outside it
+# to NaN. The polygon's rings (outer rings and holes alike) are rasterized with an even-odd scanline fill: for each
+# grid row the crossings of the row with every ring edge are found and sorted, and a node is inside when an odd number
+# of crossings lie to its left. The grid is processed one tile at a time so memory stays bounded on any grid size.
+# Overview levels (groups written by netcdf_output.write_overviews) are block statistics of 'elev', so they are
+# rebuilt from the masked grid rather than masked themselves.
+
+import fiona
+import netCDF4 as nc
+import numpy as np
+import shapely.geometry as geometry
+
+import instrumentation
+import netcdf_output
+from gridding import tile_slices
+
+
+def read_boundary(path):
+    """
+    Read every polygon of a shapefile (e.g. 'boundary.shp') into one geometry.
+    path: path to the shapefile.
+    """
+    with fiona.open(path) as features:
+        shapes = [geometry.shape(feature['geometry']) for feature in features]
+    return shapes[0] if len(shapes) == 1 else geometry.MultiPolygon(
+        [polygon for shape in shapes for polygon in getattr(shape, 'geoms', [shape])])
+
+
+def polygon_edges(shape):
+    """
+    Edges of every ring of a Polygon or MultiPolygon as an (n, 4) array of x0, y0, x1, y1, sorted by lowest y.
+    Horizontal edges are dropped as they never cross a scanline.
+    """
+    rings = [ring for polygon in getattr(shape, 'geoms', [shape]) for ring in [polygon.exterior, *polygon.interiors]]
+    edges = np.concatenate([np.column_stack((c[:-1], c[1:])) for c in (np.asarray(r.coords)[:, :2] for r in rings)])
+    edges = edges[edges[:, 1] != edges[:, 3]]
+    return edges[np.argsort(np.minimum(edges[:, 1], edges[:, 3]), kind='stable')]
+
+
+def polygon_mask(edges, xi, yi):
+    """
+    Even-odd fill of polygon edges onto grid nodes, returning a boolean array of shape (yi.size, xi.size).
+    edges: (n, 4) array from polygon_edges.
+    xi: increasing 1D grid x coordinates.
+    yi: 1D grid y coordinates.
+    """
+    mask = np.zeros((yi.size, xi.size), dtype=bool)
+    # only the edges spanning the tile's rows take part, the edges are sorted by their lowest y
+    near = edges[:np.searchsorted(np.minimum(edges[:, 1], edges[:, 3]), yi.max(), side='right')]
+    near = near[np.maximum(near[:, 1], near[:, 3]) >= yi.min()]
+    x0, y0, x1, y1 = near.T
+    for row, y in enumerate(yi):
+        crossing = (y0 <= y) != (y1 <= y)  # half-open, so a vertex on the scanline is counted once
+        xs = np.sort(x0[crossing] + (y - y0[crossing]) * (x1[crossing] - x0[crossing]) / (y1[crossing] - y0[crossing]))
+        mask[row] = np.searchsorted(xs, xi, side='right') % 2 == 1
+    return mask
+
+
+def grid_variables(ds):
+    """
+    Names of the floating point (y, x) variables of a dataset, the ones masking applies to by default.
+    Auxiliary coordinates (e.g. 'lat' and 'lon') are left out.
+    """
+    coordinates = {name for var in ds.variables.values() for name in getattr(var, 'coordinates', '').split()}
+    return [name for name, var in ds.variables.items()
+            if var.dimensions == ('y', 'x') and var.dtype.kind == 'f' and name not in coordinates]
+
+
+def mask_grid(path, shape, output=None, variables=None, tile_size=1024):
+    """
+    Set the grid nodes of a NetCDF outside a polygon to NaN, tile by tile. When 'elev' is masked its overview groups
+    are rebuilt from the masked grid, in one more tiled read of it.
+    path: NetCDF with 1D 'x' and 'y' coordinate variables, e.g. 'bathymetry_UTM.nc'.
+    shape: boundary Polygon or MultiPolygon, holes are masked too.
+    output: path of a new masked NetCDF, None masks the input file in place.
+    variables: names of the (y, x) variables to mask, None masks every floating point grid variable.
+    tile_size: number of grid nodes along each side of a tile.
+    """
+    edges = polygon_edges(shape)
+    if output is None:
+        src = dst = nc.Dataset(path, 'r+')
+    else:
+        src, dst = nc.Dataset(path), nc.Dataset(output, 'w', 'NETCDF4')
+        _copy_structure(src, dst, rebuild_overviews=variables is None or 'elev' in variables)
+    variables = grid_variables(src) if variables is None else list(variables)
+    # a new file also gets the grid variables that are not masked, copied unchanged tile by tile in the same pass
+    unmasked = [name for name in grid_variables(src) if name not in variables] if dst is not src else []
+    for name in unmasked:
+        src[name].set_auto_maskandscale(False)  # raw values, so NaN and fill values are copied as they are stored
+        dst[name].set_auto_maskandscale(False)
+    xi, yi = src['x'][:].data.astype(np.float64), src['y'][:].data.astype(np.float64)
+
+    for ys in tile_slices(yi.size, tile_size):
+        for xs in tile_slices(xi.size, tile_size):
+            outside = ~polygon_mask(edges, xi[xs], yi[ys])
+            for name in variables:
+                if outside.any() or dst is not src:
+                    tile = src[name][ys, xs].filled(np.nan)
+                    tile[outside] = np.nan
+                    with instrumentation.hot('netcdf_write', tile.size):
+                        dst[name][ys, xs] = tile
+            for name in unmasked:
+                tile = src[name][ys, xs]
+                with instrumentation.hot('netcdf_write', tile.size):
+                    dst[name][ys, xs] = tile
+
+    if 'elev' in variables:
+        gx, gy = _grid_coordinates(src['x']), _grid_coordinates(src['y'])
+        for statistics, factors in _overview_levels(dst, gx[1] - gx[0] if gx.size > 1 else 1.0).items():
+            netcdf_output.write_overviews(dst, dst['elev'], gx, gy, factors, statistics, tile_size=tile_size)
+
+    if output is not None:
+        src.close()
+    dst.close()
+
+
+def _grid_coordinates(var):
+    # evenly spaced coordinates from the float64 range stored with a float32 coordinate variable, so the resolution
+    # matches the one the overview groups were named with
+    values = var[:].data.astype(np.float64)
+    if 'actual_range' in var.ncattrs() and values.size > 1:
+        low, high = np.asarray(var.actual_range, dtype=np.float64)
+        return low + np.arange(values.size) * (high - low) / (values.size - 1)
+    return values
+
+
+def _overview_levels(ds, resolution):
+    # factors of the overview groups of ds by their statistics, the first statistic being the one stored in 'elev'
+    methods = {method: statistic for statistic, method in netcdf_output.CELL_METHODS.items()}
+    levels = {}
+    for name, group in ds.groups.items():
+        if name.startswith('overview_') and name.endswith('m') and 'elev' in group.variables:
+            statistics = [methods[group['elev'].cell_methods]] + [var[len('elev_'):] for var in group.variables
+                                                                   if var.startswith('elev_')]
+            factor = int(round(float(name[len('overview_'):-1]) / resolution))
+            levels.setdefault(tuple(statistics), []).append(factor)
+    return levels
+
+
+def _copy_structure(src, dst, skip_grid=True, rebuild_overviews=False):
+    # copy dimensions, attributes, variables and groups, without the data of the grid variables when skip_grid (they
+    # are masked or copied tile by tile) and of the overview grids when they are rebuilt from the masked grid
+    dst.setncatts(src.__dict__)
+    for name, dim in src.dimensions.items():
+        dst.createDimension(name, None if dim.isunlimited() else len(dim))
+    grid = set(grid_variables(src)) if skip_grid else set()
+    for name, var in src.variables.items():
+        out = dst.createVariable(name, var.datatype, var.dimensions, fill_value=getattr(var, '_FillValue', None),
+                                 **_storage_options(var))
+        out.setncatts({k: v for k, v in var.__dict__.items()
+                       if k not in ('_FillValue', 'least_significant_digit') and not k.startswith('_Quantize')})
+        if name not in grid:
+            out[...] = var[...]
+    for name, group in src.groups.items():
+        _copy_structure(group, dst.createGroup(name), rebuild_overviews and name.startswith('overview_'))
+
+
+def _storage_options(var):
+    # createVariable keyword arguments storing a copy like var: compression filter and level, shuffle, checksums,
+    # chunks, byte order and quantization (least_significant_digit only takes effect when passed here)
+    filters = var.filters() or {}
+    options = {'complevel': filters.get('complevel', 4), 'shuffle': filters.get('shuffle', False),
+               'fletcher32': filters.get('fletcher32', False), 'endian': var.endian()}
+    for compression in ('zlib', 'zstd', 'bzip2'):
+        if filters.get(compression):
+            options['compression'] = compression
+    if filters.get('blosc'):
+        options.update(compression=filters['blosc']['compressor'], blosc_shuffle=filters['blosc']['shuffle'])
+    if filters.get('szip'):
+        options.update(compression='szip', szip_coding=filters['szip']['coding'],
+                       szip_pixels_per_block=filters['szip']['pixels_per_block'])
+    chunks = var.chunking()
+    options['chunksizes'] = None if chunks == 'contiguous' else chunks
+    if 'least_significant_digit' in var.ncattrs():
+        options['least_significant_digit'] = var.least_significant_digit
+    quantization = var.quantization()
+    if quantization is not None:
+        options['significant_digits'], options['quantize_mode'] = quantization
+    return options
@@ -0,0 +1,284 @@
+# Filename: 'netcdf_output.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module creates the gridded bathymetry NetCDF in UTM coordinates. The 'elev' variable is created before any
+# interpolation takes place so that gridding stages can write it one tile at a time. Binned grids can add one extra
+# variable per statistic, described with CF cell_methods, and the distance from each grid node to the nearest sounding
+# can be stored alongside. Grid variables can be compressed (zlib, or zstd etc. where the netCDF library supports it),
+# byte-shuffled and quantized, and are chunked to match the gridding tiles so that each tile fills whole chunks and is
+# written without reading any chunk back.
+# CF auxiliary 'lat' and 'lon' (WGS84) coordinates can be added for every grid node. The grid stays in UTM, so cells
+# keep their size, and the coordinates are transformed one tile at a time on a thread pool and written as they finish.
+# Coarser overview levels (e.g. 2 m, 8 m and 32 m from a 0.5 m grid) are derived from the finished grid by block mean,
+# min and max in one tiled read of it, and stored as groups of the same file with their own x, y coordinates.
+# https://towardsdatascience.com/create-netcdf-files-with-python-1d86829127dd
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import netCDF4 as nc
+import numpy as np
+import pyproj
+
+import instrumentation
+
+UTM_ZONE30N = 'WGS_1984_UTM_Zone_30N'
+UTM_ZONE30N_EPSG = 'EPSG:32630'
+UTM_ZONE30N_WKT = 'PROJCS["WGS_1984_UTM_Zone_30N", GEOGCS["GCS_WGS_1984", DATUM["D_WGS_1984",' +\
+                  'SPHEROID["WGS_1984",6378137.0,298.257223563]], PRIMEM["Greenwich",0.0],' +\
+                  'UNIT["Degree",0.0174532925199433]], PROJECTION["Transverse_Mercator"],' +\
+                  'PARAMETER["False_Easting",500000.0], PARAMETER["False_Northing",0.0],' +\
+                  'PARAMETER["Central_Meridian",-3.0], PARAMETER["Scale_Factor",0.9996],' +\
+                  'PARAMETER["Latitude_Of_Origin",0.0], UNIT["Meter",1.0]]'
+
+CELL_METHODS = {'mean': 'area: mean', 'median': 'area: median', 'min': 'area: minimum', 'max': 'area: maximum',
+                'std': 'area: standard_deviation', 'count': 'area: sum'}
+
+
+def grid_encoding(shape, tile_size=1024, compression='zlib', complevel=4, shuffle=True, least_significant_digit=None):
+    """
+    Return the createVariable keyword arguments for a (y, x) grid variable.
+    shape: (ny, nx) size of the grid.
+    tile_size: chunk side length, matching the gridding tile size so tiles are written as whole chunks.
+    compression: 'zlib', another filter supported by the netCDF library (e.g. 'zstd') or None for no compression.
+    complevel: compression level, 1 (fastest) to 9 (smallest).
+    shuffle: apply the byte shuffle filter before compressing, which usually compresses floats much better.
+    least_significant_digit: quantize values to this many decimal places (e.g. 2 for centimetres), None is lossless.
+    """
+    return {'compression': compression, 'complevel': complevel, 'shuffle': shuffle and compression is not None,
+            'chunksizes': (min(tile_size, shape[0]), min(tile_size, shape[1])),
+            'least_significant_digit': least_significant_digit}
+
+
+def create_utm_dataset(path, xi, yi, grid_mapping=UTM_ZONE30N, spatial_ref=UTM_ZONE30N_WKT, encoding=None):
+    """
+    Create a NetCDF file with x, y coordinate variables and an empty 'elev' variable, returning (ds, elev).
+    path: path of the NetCDF file to write.
+    xi, yi: 1D grid coordinates (UTM easting and northing).
+    grid_mapping: name of the coordinate reference system variable.
+    spatial_ref: WKT of the coordinate reference system.
+    encoding: createVariable keyword arguments for 'elev' (see grid_encoding), None for netCDF4's defaults.
+    """
+    ds = nc.Dataset(path, 'w', 'NETCDF4')  # using netCDF4 for output format
+
+    create_coordinates(ds, xi, yi, grid_mapping)
+    elev = ds.createVariable('elev', 'f4', ('y', 'x',), **(encoding or {}))
+
+    crs = ds.createVariable(grid_mapping, 'c')
+    crs.spatial_ref = spatial_ref
+
+    elev.units = 'm'
+    elev.positive = "up"
+    elev.grid_mapping = grid_mapping
+
+    return ds, elev
+
+
+def create_coordinates(ds, xi, yi, grid_mapping=UTM_ZONE30N):
+    """
+    Create the x, y dimensions and coordinate variables of a UTM grid in a dataset or group, returning it.
+    ds: open NetCDF dataset or group.
+    xi, yi: 1D grid coordinates (UTM easting and northing).
+    grid_mapping: name of the coordinate reference system variable.
+    """
+    ds.createDimension('x', xi.size)
+    ds.createDimension('y', yi.size)
+
+    xs = ds.createVariable('x', 'f4', ('x',))
+    ys = ds.createVariable('y', 'f4', ('y',))
+
+    xs[:] = xi
+    xs.long_name = 'Easting'
+    xs.standard_name = 'projection_x_coordinate'
+    xs.units = 'm'
+    xs.grid_mapping = grid_mapping
+    xs.grid_mapping_name = 'Northing Easting'
+    xs.actual_range = (xi.min(), xi.max())
+
+    ys[:] = yi
+    ys.long_name = 'Northing'
+    ys.standard_name = 'projection_y_coordinate'
+    ys.units = 'm'
+    ys.grid_mapping = grid_mapping
+    ys.grid_mapping_name = 'Northing Easting'
+    ys.actual_range = (yi.min(), yi.max())
+
+    return ds
+
+
+def create_statistic_variable(ds, name, statistic, grid_mapping=UTM_ZONE30N, encoding=None):
+    """
+    Add a (y, x) variable holding one per-cell statistic of the binned points, returning the variable.
+    ds: open NetCDF dataset created by create_utm_dataset.
+    name: variable name, e.g. 'elev_max'.
+    statistic: one of 'mean', 'median', 'min', 'max', 'std' or 'count'.
+    grid_mapping: name of the coordinate reference system variable.
+    encoding: createVariable keyword arguments (see grid_encoding), None for netCDF4's defaults.
+    """
+    encoding = dict(encoding or {})
+    if statistic == 'count':
+        encoding.pop('least_significant_digit', None)  # counts are stored exactly
+        var = ds.createVariable(name, 'i4', ('y', 'x',), **encoding)
+        var.long_name = 'Number of points in cell'
+        var.units = '1'
+    else:
+        var = ds.createVariable(name, 'f4', ('y', 'x',), **encoding)
+        var.units = 'm'
+        if statistic != 'std':
+            var.positive = "up"
+    var.cell_methods = CELL_METHODS[statistic]
+    var.grid_mapping = grid_mapping
+    return var
+
+
+def create_distance_variable(ds, name='dist', grid_mapping=UTM_ZONE30N, encoding=None):
+    """
+    Add a (y, x) variable holding the distance from each grid node to its nearest point, returning the variable.
+    ds: open NetCDF dataset created by create_utm_dataset.
+    name: variable name.
+    grid_mapping: name of the coordinate reference system variable.
+    encoding: createVariable keyword arguments (see grid_encoding), None for netCDF4's defaults.
+    """
+    var = ds.createVariable(name, 'f4', ('y', 'x',), **(encoding or {}))
+    var.long_name = 'Distance to nearest sounding'
+    var.units = 'm'
+    var.grid_mapping = grid_mapping
+    return var
+
+
+def add_geographic_coordinates(ds, xi, yi, crs=UTM_ZONE30N_EPSG, tile_size=1024, workers=None, encoding=None):
+    """
+    Add 2D 'lat' and 'lon' (WGS84) auxiliary coordinate variables to a UTM dataset and point the (y, x) grid variables
+    at them, transforming the grid nodes one tile at a time on a thread pool.
+    ds: open NetCDF dataset created by create_utm_dataset.
+    xi, yi: 1D grid coordinates (UTM easting and northing).
+    crs: coordinate reference system of xi and yi.
+    tile_size: number of grid nodes along each side of a tile.
+    workers: number of threads, defaults to the number of cores.
+    encoding: createVariable keyword arguments (see grid_encoding), None for netCDF4's defaults.
+    """
+    encoding = dict(encoding or {})
+    encoding.pop('least_significant_digit', None)  # degrees need full precision for sub-metre grids
+    lat = ds.createVariable('lat', 'f8', ('y', 'x',), **encoding)
+    lat.standard_name = 'latitude'
+    lat.long_name = 'Latitude'
+    lat.units = 'degrees_north'
+    lon = ds.createVariable('lon', 'f8', ('y', 'x',), **encoding)
+    lon.standard_name = 'longitude'
+    lon.long_name = 'Longitude'
+    lon.units = 'degrees_east'
+
+    for name, var in ds.variables.items():
+        if var.dimensions == ('y', 'x') and name not in ('lat', 'lon'):
+            var.coordinates = 'lat lon'
+
+    local = threading.local()  # transformers are not thread-safe, so each thread builds its own
+
+    def transform(ys, xs):
+        if not hasattr(local, 'transformer'):
+            local.transformer = pyproj.Transformer.from_crs(crs, 'EPSG:4326', always_xy=True)
+        gx, gy = np.meshgrid(xi[xs], yi[ys])
+        return local.transformer.transform(gx, gy)
+
+    tiles = [(slice(a, min(a + tile_size, yi.size)), slice(b, min(b + tile_size, xi.size)))
+             for a in range(0, yi.size, tile_size) for b in range(0, xi.size, tile_size)]
+    workers = workers or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for ys, xs in tiles:
+            pending.append((ys, xs, pool.submit(transform, ys, xs)))
+            if len(pending) >= 2 * workers:  # bound the number of tiles in memory, netCDF4 writes stay on this thread
+                ys, xs, future = pending.popleft()
+                tile_lon, tile_lat = future.result()
+                with instrumentation.hot('netcdf_write', 2 * tile_lon.size):
+                    lon[ys, xs], lat[ys, xs] = tile_lon, tile_lat
+        while pending:
+            ys, xs, future = pending.popleft()
+            tile_lon, tile_lat = future.result()
+            with instrumentation.hot('netcdf_write', 2 * tile_lon.size):
+                lon[ys, xs], lat[ys, xs] = tile_lon, tile_lat
+    return lat, lon
+
+
+def write_overviews(ds, source, xi, yi, factors, statistics=('mean', 'min', 'max'), grid_mapping=UTM_ZONE30N,
+                    tile_size=1024, encoding=None, region=None):
+    """
+    Aggregate a finished (y, x) grid into coarser overview levels stored as groups named e.g. 'overview_2m', each
+    with its own x, y coordinates (block centres), 'elev' holding the first statistic and 'elev_<statistic>' the rest.
+    The source grid is read once in tiles whose sides are a multiple of every factor, and every level is filled from
+    each tile before the next is read. Blocks with no valid grid nodes are NaN.
+    ds: open NetCDF dataset to add the groups to.
+    source: array-like of shape (yi.size, xi.size), e.g. the 'elev' variable.
+    xi, yi: 1D, evenly spaced grid coordinates of source.
+    factors: integer block sizes, e.g. [4, 16, 64] for 2, 8 and 32 m overviews of a 0.5 m grid.
+    statistics: any of 'mean', 'min' and 'max'.
+    grid_mapping: name of the coordinate reference system variable.
+    tile_size: approximate side length of the tiles read, rounded up to a multiple of every factor.
+    encoding: createVariable keyword arguments of the source grid (see grid_encoding), chunks are reduced to fit.
+    region: optional (row slice, column slice) of source that changed, only the overview blocks covering it are
+    rewritten, in the existing groups.
+    """
+    unknown = set(statistics) - {'mean', 'min', 'max'}
+    if unknown:
+        raise ValueError("Unknown statistics %s, choose from 'mean', 'min' and 'max'" % sorted(unknown))
+    resolution = xi[1] - xi[0] if xi.size > 1 else 1.0
+    levels = []
+    for factor in factors:
+        gx = xi[0] + (factor - 1) * resolution / 2 + np.arange(-(-xi.size // factor)) * factor * resolution
+        gy = yi[0] + (factor - 1) * resolution / 2 + np.arange(-(-yi.size // factor)) * factor * resolution
+        name = 'overview_%gm' % (factor * resolution)
+        if name in ds.groups:
+            group = ds.groups[name]
+            variables = {statistic: group.variables['elev' if i == 0 else 'elev_' + statistic]
+                         for i, statistic in enumerate(statistics)}
+            levels.append((factor, variables))
+            continue
+        group = create_coordinates(ds.createGroup(name), gx, gy, grid_mapping)
+        level_encoding = dict(encoding or {})
+        if 'chunksizes' in level_encoding:
+            level_encoding['chunksizes'] = (min(tile_size, gy.size), min(tile_size, gx.size))
+        variables = {}
+        for i, statistic in enumerate(statistics):
+            name = 'elev' if i == 0 else 'elev_' + statistic
+            variables[statistic] = create_statistic_variable(group, name, statistic, grid_mapping, level_encoding)
+        levels.append((factor, variables))
+
+    step = int(np.lcm.reduce(factors))
+    step *= -(-tile_size // step)
+    rows, columns = region if region is not None else (slice(0, yi.size), slice(0, xi.size))
+    for y0 in range(rows.start // step * step, rows.stop, step):
+        for x0 in range(columns.start // step * step, columns.stop, step):
+            tile = np.ma.filled(source[y0:y0 + step, x0:x0 + step], np.nan).astype(np.float64)
+            for factor, variables in levels:
+                blocks = _block_statistics(tile, factor, statistics)
+                ys = slice(y0 // factor, y0 // factor + blocks[statistics[0]].shape[0])
+                xs = slice(x0 // factor, x0 // factor + blocks[statistics[0]].shape[1])
+                for statistic, var in variables.items():
+                    with instrumentation.hot('netcdf_write', blocks[statistic].size):
+                        var[ys, xs] = blocks[statistic]
+
+
+def _block_statistics(tile, factor, statistics):
+    # pad the tile to whole blocks with NaN, then reduce each factor x factor block ignoring NaN
+    ny, nx = -(-tile.shape[0] // factor), -(-tile.shape[1] // factor)
+    padded = np.full((ny * factor, nx * factor), np.nan)
+    padded[:tile.shape[0], :tile.shape[1]] = tile
+    blocks = padded.reshape(ny, factor, nx, factor)
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=(1, 3))
+    empty = count == 0
+    results = {}
+    for statistic in statistics:
+        if statistic == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                grid = np.where(valid, blocks, 0.0).sum(axis=(1, 3)) / count
+        elif statistic == 'min':
+            grid = np.where(valid, blocks, np.inf).min(axis=(1, 3))
+        else:
+            grid = np.where(valid, blocks, -np.inf).max(axis=(1, 3))
+        grid[empty] = np.nan
+        results[statistic] = grid
+    return results
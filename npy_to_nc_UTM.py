@@ -3,102 +3,278 @@
 # Author: Connor Jordan
 # Institution: University of Edinburgh (IIE)
 # This script converts an .npy array of format UTM x-coordinate, UTM y-coordinate, elevation into a NetCDF of format
-# latitude, longitude, elevation.
+# UTM x-coordinate, UTM y-coordinate, elevation, optionally with the latitude and longitude of every grid node.
 # https://towardsdatascience.com/create-netcdf-files-with-python-1d86829127dd
 
+import os
+import inspect
 import numpy as np
-from scipy.interpolate import griddata
 import netCDF4 as nc
-from datetime import datetime
+from scipy.interpolate import griddata
+import point_store
+import gridding
+import netcdf_output
+from cache import Cache
+import instrumentation
+
+point_file = 'bathymetry.npy'  # point store from 'txt_to_npy.py', .npy or compact .npz
+resolution = 0.5  # desired resolution in m
+method = 'nearest'  # griddata interpolation method, choose 'nearest', 'linear' or 'cubic'
+grid_mode = 'full'  # choose 'full' (whole grid at once), 'tiled' (tile by tile, for grids too large to mesh),
+# 'kdtree' (nearest neighbour), 'binning' (per-cell statistics of the points, best when the resolution is much coarser
+# than the survey) or 'rbf' (smooth surface from local radial basis functions fitted per tile in parallel)
+tile_size = 1024  # grid nodes along each side of a tile in tiled and kdtree modes, sets the peak memory use
+halo = 10  # m, points up to this distance outside a tile are also used to interpolate it
+max_distance = None  # m, in kdtree mode grid nodes further than this from every point are NaN, None for no limit
+statistics = ['mean', 'min', 'max', 'count', 'std']  # binning mode, the first is written to elev, the rest to elev_*
+overlap = 16  # rbf mode, grid nodes by which neighbouring tiles overlap and are blended
+rbf_neighbors = 10  # rbf mode, number of nearest points used by each local RBF evaluation
+rbf_kernel = 'thin_plate_spline'  # rbf mode, scipy RBFInterpolator kernel
+workers = None  # rbf mode processes and lat/lon threads, None uses every core
+distance_mask = None  # m, after gridding grid nodes further than this from every sounding are set to NaN, None to keep
+store_distance = False  # write the distance from each grid node to the nearest sounding to the 'dist' variable
+overview_factors = []  # coarser levels as multiples of the resolution, e.g. [4, 16, 64] for 2, 8 and 32 m at 0.5 m
+overview_statistics = ['mean', 'min', 'max']  # block statistics of each overview level, the first is written to elev
+geographic = False  # add 2D WGS84 'lat' and 'lon' coordinates of every grid node, the grid itself stays in UTM
+compression = 'zlib'  # NetCDF compression filter, e.g. 'zlib' or 'zstd', None to store uncompressed
+complevel = 4  # compression level, 1 (fastest) to 9 (smallest)
+shuffle = True  # byte shuffle before compressing, usually much smaller files for float data
+least_significant_digit = None  # quantize to this many decimal places (2 = centimetres), None keeps full precision
+update_file = None  # new survey lines (an .npy from txt_to_npy.py) to add to the delta store of point_file, regridding
+# only the tiles of the existing 'bathymetry_UTM.nc' within the halo of the new points (tiled mode, same settings)
+cache_dir = '.cache'  # tiled mode, cache of the tile index and interpolated tiles keyed on their inputs, None disables
+cache_size = 20 * 1024 ** 3  # bytes, least recently used cache entries are deleted beyond this
+trace_file = 'npy_to_nc_UTM_trace.json'  # per-step time, CPU, peak memory, IO and item counts (.json or .csv), or None
+profile = False  # also sample the Python stacks, written to trace_file + '.folded' for flame graph tools
 
-starttime = datetime.now()  # calculating run times
+trace = instrumentation.Trace('npy_to_nc_UTM', trace_file, profile=profile)  # records each step, calculating run times
 
-print('Modules imported... (', datetime.now() - starttime, ')')
+index_file = point_store.index_path(point_file)  # tile index of point_file, saved by tiled mode and used by updates
 
-dt_string = starttime.strftime("%d/%m/%Y %H:%M:%S")
+dt_string = trace.started.strftime("%d/%m/%Y %H:%M:%S")
 print("Simulation start: ", dt_string, '\n')
 
-data = np.load('bathymetry.npy')
+rebuild_overviews = False  # set by updates of a file missing some of the overview levels, which are built in full
 
-print('Bathymetry data loaded... (', datetime.now() - starttime, ')')
+if update_file is not None:
+    # Check the settings, the existing grid and overviews and the saved tile index before touching any file, then add
+    # the new points to the delta store of point_file. The store and its saved index are never changed by an update and
+    # the delta store is replaced in one step, so a failed update leaves every file as it was and can simply be rerun
+    if grid_mode != 'tiled':
+        raise ValueError("Updates need grid_mode = 'tiled'")
+    if store_distance or (distance_mask is not None and distance_mask > halo):
+        raise ValueError("Updates need store_distance = False and distance_mask no larger than halo")
+    New = point_store.open_store(update_file)
+    if len(New) == 0:
+        raise ValueError("'%s' holds no points" % update_file)
 
-X_UTM = data[:, 0]
-Y_UTM = data[:, 1]
-Elevation = data[:, 2]
+    # Open the existing grid and rebuild its coordinates from the stored range, the grid itself does not grow
+    ds = nc.Dataset('bathymetry_UTM.nc', 'r+')
+    elev = ds['elev']
+    xi = ds['x'].actual_range[0] + np.arange(ds.dimensions['x'].size) * resolution
+    yi = ds['y'].actual_range[0] + np.arange(ds.dimensions['y'].size) * resolution
+    if max(abs(xi[-1] - ds['x'].actual_range[1]), abs(yi[-1] - ds['y'].actual_range[1])) > resolution / 2:
+        raise ValueError("resolution does not match 'bathymetry_UTM.nc'")
+    encoding = None
+    # Overview levels are only refreshed over the regridded tiles, so a level missing from the file is built in full
+    # from the updated grid instead, and a level lacking one of overview_statistics cannot be updated
+    levels = ['overview_%gm' % (factor * resolution) for factor in overview_factors]
+    names = ['elev'] + ['elev_' + statistic for statistic in overview_statistics[1:]]
+    for level in levels:
+        if level in ds.groups and any(name not in ds[level].variables for name in names):
+            raise ValueError("'%s' of 'bathymetry_UTM.nc' does not hold every one of overview_statistics, rerun "
+                             "without update_file" % level)
+    rebuild_overviews = any(level not in ds.groups for level in levels)
+    if rebuild_overviews:
+        encoding = netcdf_output.grid_encoding((yi.size, xi.size), tile_size, compression, complevel, shuffle,
+                                               least_significant_digit)
+    grid = (xi[0], yi[0], tile_size * resolution, len(gridding.tile_slices(xi.size, tile_size)),
+            len(gridding.tile_slices(yi.size, tile_size)))
 
-# Assign NaN (Not a Number) to land points (invalid points) -  prevents errors from occurring but does not
-# impact interpolation. Also make any processing changes e.g. for offset in elevation data
-elev_list = np.where(Elevation <= 0, np.nan, Elevation - 49.32)
+    store = point_store.open_store(point_file)
+    index = point_store.TileIndex.load(index_file) if os.path.exists(index_file) else None
+    if index is not None and index.offsets[-1] != len(store):
+        raise ValueError("'%s' does not match '%s', delete it to rebuild it" % (index_file, point_file))
+    if index is not None and (index.x0, index.y0, index.extent, index.ntx, index.nty) != grid:
+        raise ValueError("'%s' was built for another grid or tile_size, delete it to rebuild it" % index_file)
+    if index is None:
+        index = point_store.TileIndex.build(store[:, 0], store[:, 1], *grid)
+        index.save(index_file)  # only describes point_file itself, which updates leave unchanged
+    del store
+    point_store.add_points(point_file, New)
 
-print('Data sliced... (', datetime.now() - starttime, ')')
+    trace.step('add_points', 'New points added to the delta store', items=len(New))
 
-min_X_UTM, max_X_UTM, min_Y_UTM, max_Y_UTM = min(X_UTM), max(X_UTM), min(Y_UTM), max(Y_UTM)
+# Memory-map the point store rather than reading it into memory, x, y and z are contiguous columns (decoded as they are
+# read for a compact store), followed by the points of the delta store if updates have added any
+X_UTM, Y_UTM, Elevation = point_store.load_points(point_file)
 
-resolution = 0.5  # desired resolution in m
+trace.step('load', 'Bathymetry data loaded', items=len(X_UTM))
+
+
+def process_elevation(elevation):
+    # Assign NaN (Not a Number) to land points (invalid points) -  prevents errors from occurring but does not
+    # impact interpolation. Also make any processing changes e.g. for offset in elevation data
+    return np.where(elevation <= 0, np.nan, elevation - 49.32)
+
+
+if update_file is None:
+    min_X_UTM, max_X_UTM, min_Y_UTM, max_Y_UTM = X_UTM.min(), X_UTM.max(), Y_UTM.min(), Y_UTM.max()
+
+    x_number = np.abs(max_X_UTM-min_X_UTM) / resolution
+    y_number = np.abs(max_Y_UTM-min_Y_UTM) / resolution
+
+    print('Number of interpolated points:', x_number*y_number)
+
+    xi = np.arange(min_X_UTM, max_X_UTM+resolution, resolution)  # Set up grid x coordinates
+    yi = np.arange(min_Y_UTM, max_Y_UTM+resolution, resolution)  # Set up grid y coordinates
+
+    trace.step('grid_setup', 'Grid coordinates set up', items=xi.size * yi.size)
+
+    # Create the NetCDF first so the elevation can be written to it tile by tile, chunked to match the tiles
+    encoding = netcdf_output.grid_encoding((yi.size, xi.size), tile_size, compression, complevel, shuffle,
+                                           least_significant_digit)
+    ds, elev = netcdf_output.create_utm_dataset('bathymetry_UTM.nc', xi, yi, encoding=encoding)
+
+tree = None  # KD-tree over the points, shared by the kdtree mode and the distance mask
+region = None  # rows and columns of the grid rewritten by an update, None for the whole grid
+
+if update_file is not None:
+    # Index the delta store on the same tiles as the saved index of point_file and regrid only the tiles whose halo
+    # holds a new point, with the distance mask applied per tile from the points in its halo
+    ntx, nty = grid[3], grid[4]
+    index = point_store.ChainedIndex(index, point_store.TileIndex.build(X_UTM.delta, Y_UTM.delta, *grid))
+    new_x, new_y = np.asarray(New[:, 0], dtype=np.float64), np.asarray(New[:, 1], dtype=np.float64)
+    tiles = index.tiles_near(new_x, new_y, halo)
+    outside = np.sum((new_x < xi[0]) | (new_x > xi[-1]) | (new_y < yi[0]) | (new_y > yi[-1]))
+    if outside:
+        print(outside, 'new points lie outside the existing grid, rerun without update_file to extend it')
+
+    trace.step('update_index', 'Delta store indexed, regridding %d of %d tiles' % (len(tiles), ntx * nty),
+               items=len(X_UTM.delta))
+
+    gridding.grid_tiled(X_UTM, Y_UTM, Elevation, xi, yi, elev, method=method, tile_size=tile_size, halo=halo,
+                        preprocess=process_elevation, index=index, tiles=tiles, max_distance=distance_mask)
+    if len(tiles):
+        region = (slice(tiles.min() // ntx * tile_size, (tiles.max() // ntx + 1) * tile_size),
+                  slice((tiles % ntx).min() * tile_size, ((tiles % ntx).max() + 1) * tile_size))
+    distance_mask = None  # already applied to the regridded tiles
+
+    trace.step('regrid_tiles', 'Tiles regridded and written to NetCDF', items=len(tiles))
+elif grid_mode == 'full':
+    xx, yy = np.meshgrid(xi, yi, indexing='ij')  # Create grid of values, xx is grid of x values and likewise for yy
+
+    trace.step('mesh', 'Grid meshed', items=xi.size * yi.size)
+
+    # Interpolate velocity and direction fields from coordinates (x,y) to grid (xx, yy)
+    elev_grid = griddata((X_UTM, Y_UTM), process_elevation(np.asarray(Elevation)), (xx, yy), method=method)
+
+    elev_grid_ = np.transpose(elev_grid)
 
-x_number = np.abs(max_X_UTM-min_X_UTM) / resolution
-y_number = np.abs(max_Y_UTM-min_Y_UTM) / resolution
+    trace.step('grid', 'Data interpolated to grid', items=xi.size * yi.size)
 
-print('Number of interpolated points:', x_number*y_number)
+    elev[:, :] = elev_grid_
 
-xi = np.arange(min_X_UTM, max_X_UTM+resolution, resolution)  # Set up grid x coordinates
-yi = np.arange(min_Y_UTM, max_Y_UTM+resolution, resolution)  # Set up grid y coordinates
+    trace.step('write', 'Grid written to NetCDF', items=xi.size * yi.size)
+elif grid_mode == 'tiled':
+    # Interpolate each tile from the points inside it plus a halo and write it straight into the NetCDF, so only
+    # one tile of the grid is ever held in memory
+    # The tile index is saved so later updates can regrid only the tiles near new points
+    # A store sorted by 'txt_to_npy.py' on the same tiles comes with its index, each tile being one range of rows
+    # Points added by updates are indexed separately, the saved index only ever describes point_file itself
+    grid = (xi[0], yi[0], tile_size * resolution, len(gridding.tile_slices(xi.size, tile_size)),
+            len(gridding.tile_slices(yi.size, tile_size)))
+    delta = isinstance(X_UTM, point_store.ChainedColumn)
+    rows = X_UTM.rows if delta else len(X_UTM)  # points of point_file itself
+    index = point_store.TileIndex.load(index_file) if os.path.exists(index_file) else None
+    if index is not None and (index.order is not None or index.offsets[-1] != rows or
+                              (index.x0, index.y0, index.extent, index.ntx, index.nty) != grid):
+        index = None
+    if index is not None and delta:
+        index = point_store.ChainedIndex(index, point_store.TileIndex.build(X_UTM.delta, Y_UTM.delta, *grid))
+    cache, tiles_key = None, None
+    if cache_dir is not None:
+        # Reuse the index and every interpolated tile when the points and gridding settings are unchanged, e.g. when
+        # only the output encoding, distance mask or overviews change
+        cache = Cache(cache_dir, cache_size)
+        points_key = [cache.file_digest(path) for path in point_store.store_files(point_file)]
+        if index is None:
+            index = point_store.TileIndex.load(cache.fetch(cache.key('tile_index', points_key, grid), lambda path:
+                                                           point_store.TileIndex.build(X_UTM, Y_UTM, *grid).save(path),
+                                                           '.npz'))
+        tiles_key = cache.key('grid_tiled', points_key, grid, xi.size, yi.size, method, halo,
+                              inspect.getsource(process_elevation))
+    elif index is None:
+        index = point_store.TileIndex.build(X_UTM, Y_UTM, *grid)
+    if not delta and index.order is not None:
+        index.save(index_file)
+    gridding.grid_tiled(X_UTM, Y_UTM, Elevation, xi, yi, elev, method=method, tile_size=tile_size, halo=halo,
+                        preprocess=process_elevation, index=index, cache=cache, cache_key=tiles_key)
 
-print('Grid coordinates set up... (', datetime.now() - starttime, ')')
+    trace.step('grid', 'Data interpolated to grid and written to NetCDF', items=xi.size * yi.size)
+elif grid_mode == 'kdtree':
+    # Build one KD-tree over all points and query the grid nodes of each tile on every core, leaving nodes further
+    # than max_distance from any sounding as NaN rather than copying a distant depth into data gaps
+    tree = gridding.build_tree(X_UTM, Y_UTM)
 
-xx, yy = np.meshgrid(xi, yi, indexing='ij')  # Create grid of values, xx is grid of x values and likewise for yy
+    trace.step('build_tree', 'KD-tree built', items=len(X_UTM))
 
-print('Grid meshed... (', datetime.now() - starttime, ')')
+    gridding.grid_nearest(X_UTM, Y_UTM, Elevation, xi, yi, elev, tile_size=tile_size, max_distance=max_distance,
+                          preprocess=process_elevation, tree=tree)
 
-# Interpolate velocity and direction fields from coordinates (x,y) to grid (xx, yy)
-elev_grid = griddata((X_UTM, Y_UTM), elev_list, (xx, yy), method='nearest')
+    trace.step('grid', 'Data interpolated to grid and written to NetCDF', items=xi.size * yi.size)
+elif grid_mode == 'binning':
+    # Map each point to the cell around its nearest grid node and summarise each cell in one pass over the points
+    grids = gridding.bin_points(X_UTM, Y_UTM, Elevation, xi, yi, statistics, preprocess=process_elevation)
 
-elev_grid_ = np.transpose(elev_grid)
+    trace.step('bin', 'Data binned to grid', items=len(X_UTM))
 
-print('Data interpolated to grid... (', datetime.now() - starttime, ')')
+    elev.cell_methods = netcdf_output.CELL_METHODS[statistics[0]]
+    elev[:, :] = grids[statistics[0]]
+    for statistic in statistics[1:]:
+        netcdf_output.create_statistic_variable(ds, 'elev_' + statistic, statistic,
+                                                encoding=encoding)[:, :] = grids[statistic]
 
-print('\nConverting to NetCDF... (', datetime.now() - starttime, ')')
+    trace.step('write', 'Grid statistics written to NetCDF', items=xi.size * yi.size * len(statistics))
+elif grid_mode == 'rbf':
+    # Fit a local RBF to each overlapping tile on a process pool and blend the tiles across their seams
+    gridding.grid_rbf(X_UTM, Y_UTM, Elevation, xi, yi, elev, tile_size=tile_size, overlap=overlap, halo=halo,
+                      neighbors=rbf_neighbors, kernel=rbf_kernel, preprocess=process_elevation, workers=workers)
 
-ds = nc.Dataset('bathymetry_UTM.nc', 'w', 'NETCDF4')  # using netCDF4 for output format
+    trace.step('grid', 'Data interpolated to grid and written to NetCDF', items=xi.size * yi.size)
+else:
+    raise ValueError("Choose a gridding mode! 'full', 'tiled', 'kdtree', 'binning' or 'rbf'")
 
-x = ds.createDimension('x', xi.size)
-y = ds.createDimension('y', yi.size)
+if distance_mask is not None or store_distance:
+    # Blank grid nodes far from any sounding instead of clipping to a boundary polygon, querying the distance to the
+    # nearest point for each tile of grid nodes on every core
+    if tree is None:
+        tree = gridding.build_tree(X_UTM, Y_UTM)
+    dist = netcdf_output.create_distance_variable(ds, encoding=encoding) if store_distance else None
+    grid_variables = [var for name, var in ds.variables.items() if name == 'elev' or name.startswith('elev_')]
+    gridding.mask_distance(X_UTM, Y_UTM, xi, yi, grid_variables, max_distance=distance_mask, distance=dist,
+                           tile_size=tile_size, tree=tree)
 
-xs = ds.createVariable('x', 'f4', ('x',))
-ys = ds.createVariable('y', 'f4', ('y',))
-elev = ds.createVariable('elev', 'f4', ('y', 'x',))
+    trace.step('distance', 'Distance to data computed', items=xi.size * yi.size)
 
-crs = ds.createVariable("WGS_1984_UTM_Zone_30N", 'c')
-crs.spatial_ref = 'PROJCS["WGS_1984_UTM_Zone_30N", GEOGCS["GCS_WGS_1984", DATUM["D_WGS_1984",' +\
-                  'SPHEROID["WGS_1984",6378137.0,298.257223563]], PRIMEM["Greenwich",0.0],' +\
-                  'UNIT["Degree",0.0174532925199433]], PROJECTION["Transverse_Mercator"],' +\
-                  'PARAMETER["False_Easting",500000.0], PARAMETER["False_Northing",0.0],' +\
-                  'PARAMETER["Central_Meridian",-3.0], PARAMETER["Scale_Factor",0.9996],' +\
-                  'PARAMETER["Latitude_Of_Origin",0.0], UNIT["Meter",1.0]]'
+if overview_factors and (update_file is None or region is not None or rebuild_overviews):
+    # Derive the coarser levels from the finished grid in one tiled read, rather than regridding the points for each
+    # resolution, and store each level as a group of this file
+    netcdf_output.write_overviews(ds, elev, xi, yi, overview_factors, overview_statistics, tile_size=tile_size,
+                                  encoding=encoding, region=None if rebuild_overviews else region)
 
-xs[:] = xi
-xs.long_name = 'Easting'
-xs.standard_name = 'projection_x_coordinate'
-xs.units = 'm'
-xs.grid_mapping = 'WGS_1984_UTM_Zone_30N'
-xs.grid_mapping_name = 'Northing Easting'
-xs.actual_range = (min(xi), max(xi))
+    trace.step('overviews', 'Overviews written', items=xi.size * yi.size)
 
-ys[:] = yi
-ys.long_name = 'Northing'
-ys.standard_name = 'projection_y_coordinate'
-ys.units = 'm'
-ys.grid_mapping = 'WGS_1984_UTM_Zone_30N'
-ys.grid_mapping_name = 'Northing Easting'
-ys.actual_range = (min(yi), max(yi))
+if geographic is True and 'lat' not in ds.variables:
+    # Transform the UTM grid nodes to WGS84 tile by tile on a thread pool, writing CF auxiliary coordinates so viewers
+    # can place the grid without reprojecting it
+    netcdf_output.add_geographic_coordinates(ds, xi, yi, tile_size=tile_size, workers=workers, encoding=encoding)
 
-elev.units = 'm'
-elev.positive = "up"
-elev.grid_mapping = 'WGS_1984_UTM_Zone_30N'
-elev[:, :] = elev_grid_
+    trace.step('geographic', 'Latitude and longitude written', items=xi.size * yi.size)
 
 ds.close()
+trace.step('close')
 
-simulationtime = datetime.now() - starttime  # calculate simulation time
+simulationtime = trace.close()  # calculate simulation time and write the trace
 
 print('NetCDF written, total conversion process time = ', simulationtime)
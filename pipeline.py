@@ -0,0 +1,261 @@
+# Filename: 'pipeline.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module runs the whole workflow for a survey (ingest, preprocessing, gridding, boundary generation, masking
+# and the final NetCDF outputs) in one process as a directed graph of stages. Each stage starts as soon as the stages
+# it depends on have finished and receives their results in memory: the point store is memory-mapped once and the
+# same column views are shared by every stage, and the boundary polygon is handed straight to the masking stage.
+# Independent stages (gridding and boundary generation) run at the same time on a thread pool, and several surveys
+# can be processed at once in a process pool, each with its own settings and output directory.
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import fiona
+import netCDF4 as nc
+import numpy as np
+import shapely.geometry as geometry
+
+import boundary
+import gridding
+import ingest
+import instrumentation
+import masking
+import netcdf_output
+import point_store
+
+DEFAULTS = {
+    'input_file': 'bathymetry.npy',  # .npy or compact .npz point store, or a delimited x, y, z text file to parse
+    'output_dir': '.',  # directory of the outputs ('bathymetry.npy' when parsed, 'bathymetry_UTM.nc', 'boundary.shp')
+    'delimiter': ',',  # text input, column delimiter
+    'skiprows': 1,  # text input, number of header rows
+    'spatial_sort': True,  # text input, sort the parsed points along a Hilbert curve through the gridding tiles
+    'compact': False,  # text input, store the parsed points as the compact 'bathymetry.npz' (centimetre steps)
+    'resolution': 0.5,  # m, grid resolution
+    'grid_mode': 'tiled',  # 'tiled' (griddata per tile) or 'kdtree' (nearest neighbour)
+    'method': 'nearest',  # tiled mode, griddata interpolation method
+    'tile_size': 1024,  # grid nodes along each side of a tile
+    'halo': 10.0,  # m, tiled mode, points up to this distance outside a tile are also used
+    'land_level': 0.0,  # elevations at or below this are land and left out of the grid
+    'elevation_offset': 0.0,  # m, subtracted from every elevation, e.g. a datum correction
+    'distance_mask': None,  # m, grid nodes further than this from every sounding are NaN, None to keep
+    'boundary_mode': 'raster',  # 'raster', 'custom' or 'parallel' alpha shape, None skips the boundary and masking
+    'reduction_shapefile': None,  # polygons whose points are left out of the boundary generation
+    'alpha': 1,  # custom and parallel modes, alpha value
+    'cell_size': 5,  # raster mode, m, occupancy raster cell size
+    'closing_radius': 2,  # raster mode, cells, gaps closed between survey lines
+    'max_hole_area': None,  # raster mode, m2, holes smaller than this are filled, None fills every hole
+    'write_boundary': True,  # also write the boundary to 'boundary.shp'
+    'overview_factors': [],  # coarser overview levels, e.g. [4, 16, 64]
+    'geographic': False,  # add 2D WGS84 'lat' and 'lon' coordinates
+    'compression': 'zlib',  # NetCDF compression filter, None to store uncompressed
+    'complevel': 4,  # compression level
+    'least_significant_digit': None,  # quantize to this many decimal places, None keeps full precision
+    'trace_file': 'trace.json',  # per-stage time, CPU, peak memory, IO and item counts (.json or .csv), None to skip
+    'profile': False,  # also sample the Python stacks, written to the trace file + '.folded'
+}
+
+
+class Pipeline:
+    """
+    Directed graph of named stages run on a thread pool. Each stage is a function called with the results of the
+    stages it depends on as keyword arguments (named after those stages), once they have all finished.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, function, after=(), items=None):
+        """
+        Add a stage.
+        name: stage name, also the keyword its result is passed to later stages under.
+        function: function called with the results of the stages in after.
+        after: names of the stages this stage depends on.
+        items: optional function of the stage's result giving the number of items it processed, for the trace.
+        """
+        self.stages[name] = (function, tuple(after), items)
+
+    def run(self, workers=2, log=print, trace=None):
+        """
+        Run every stage, starting each one as soon as its dependencies have finished, returning {name: result}.
+        workers: number of stages run at the same time.
+        log: function given a progress message when each stage finishes, None for no messages.
+        trace: instrumentation.Trace each stage is recorded in, None to only log progress.
+        """
+        unknown = {dep for _, after, _ in self.stages.values() for dep in after} - set(self.stages)
+        if unknown:
+            raise ValueError('Unknown stages %s' % sorted(unknown))
+        own_trace = trace is None
+        if own_trace:
+            trace = instrumentation.Trace('pipeline', log=log)
+
+        def timed(name, function, items, kwargs):
+            with trace.stage(name, 'Stage %s finished' % name) as record:
+                result = function(**kwargs)
+                if items is not None:
+                    record['items'] = items(result)
+            return result
+
+        results, waiting, running = {}, dict(self.stages), {}
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while waiting or running:
+                    for name, (function, after, items) in list(waiting.items()):
+                        if all(dep in results for dep in after):
+                            kwargs = {dep: results[dep] for dep in after}
+                            running[pool.submit(timed, name, function, items, kwargs)] = name
+                            del waiting[name]
+                    if not running:
+                        raise ValueError('Stages %s depend on each other' % sorted(waiting))
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future)] = future.result()
+        finally:
+            if own_trace:
+                trace.close()
+        return results
+
+
+def survey_pipeline(settings):
+    """
+    Build the pipeline of one survey: ingest -> prepare -> grid and boundary (at the same time) -> mask -> outputs.
+    settings: dict overriding DEFAULTS.
+    """
+    s = dict(DEFAULTS, **settings)
+    out = s['output_dir']
+    nc_path = os.path.join(out, 'bathymetry_UTM.nc')
+    pipeline = Pipeline()
+    sorted_index = []  # tile index of the store sorted by the ingest stage
+
+    def ingest_points():
+        # parse text input once into a column-major store (sorted by tile), then share memory-mapped column views
+        store = s['input_file']
+        if not store.endswith(('.npy', '.npz')):
+            store = os.path.join(out, 'bathymetry.npy')
+            ingest.stream_txt_to_npy(s['input_file'], store, delimiter=s['delimiter'], skiprows=s['skiprows'])
+            if s['spatial_sort']:
+                sorted_index.append(point_store.spatial_sort(store, extent=s['tile_size'] * s['resolution']))
+            point_store.to_columnar(store)
+            if s['compact']:
+                store = point_store.to_compact(store)
+                os.remove(os.path.join(out, 'bathymetry.npy'))
+        return point_store.load_points(store)
+
+    def prepare(ingest_points):
+        # grid coordinates and the tile index, built in one pass over the points unless the store was sorted by tile
+        x, y, _ = ingest_points
+        xi = np.arange(x.min(), x.max() + s['resolution'], s['resolution'])
+        yi = np.arange(y.min(), y.max() + s['resolution'], s['resolution'])
+        ntx = len(gridding.tile_slices(xi.size, s['tile_size']))
+        nty = len(gridding.tile_slices(yi.size, s['tile_size']))
+        grid = (xi[0], yi[0], s['tile_size'] * s['resolution'], ntx, nty)
+        if sorted_index and (sorted_index[0].x0, sorted_index[0].y0, sorted_index[0].extent, sorted_index[0].ntx,
+                             sorted_index[0].nty) == grid:
+            return xi, yi, sorted_index[0]
+        return xi, yi, point_store.TileIndex.build(x, y, *grid)
+
+    def process_elevation(elevation):
+        return np.where(elevation <= s['land_level'], np.nan, elevation - s['elevation_offset'])
+
+    def grid(ingest_points, prepare):
+        x, y, z = ingest_points
+        xi, yi, index = prepare
+        encoding = netcdf_output.grid_encoding((yi.size, xi.size), s['tile_size'], s['compression'], s['complevel'],
+                                               least_significant_digit=s['least_significant_digit'])
+        ds, elev = netcdf_output.create_utm_dataset(nc_path, xi, yi, encoding=encoding)
+        try:
+            tree = None
+            if s['grid_mode'] == 'tiled':
+                gridding.grid_tiled(x, y, z, xi, yi, elev, method=s['method'], tile_size=s['tile_size'],
+                                    halo=s['halo'], preprocess=process_elevation, index=index)
+            elif s['grid_mode'] == 'kdtree':
+                tree = gridding.build_tree(x, y)
+                gridding.grid_nearest(x, y, z, xi, yi, elev, tile_size=s['tile_size'],
+                                      preprocess=process_elevation, tree=tree)
+            else:
+                raise ValueError("Choose a gridding mode! 'tiled' or 'kdtree'")
+            if s['distance_mask'] is not None:
+                gridding.mask_distance(x, y, xi, yi, [elev], max_distance=s['distance_mask'],
+                                       tile_size=s['tile_size'], tree=tree)
+        finally:
+            ds.close()
+        return nc_path
+
+    def boundary_shape(ingest_points):
+        x, y, _ = ingest_points
+        if s['reduction_shapefile'] is not None:
+            reduced = os.path.join(out, 'bathymetry_reduced.npy')
+            boundary.reduce_points(x, y, boundary.read_regions(s['reduction_shapefile']), reduced)
+            x, y = point_store.load_points(reduced)[:2]
+        if s['boundary_mode'] == 'raster':
+            shape = boundary.raster_boundary(x, y, s['cell_size'], s['closing_radius'], s['max_hole_area'])
+        elif s['boundary_mode'] == 'custom':
+            shape = boundary.alpha_shape(np.column_stack((x, y)), s['alpha'])
+        elif s['boundary_mode'] == 'parallel':
+            shape = boundary.parallel_alpha_shape(np.column_stack((x, y)), s['alpha'])
+        else:
+            raise ValueError("Choose a boundary mode! 'raster', 'custom' or 'parallel'")
+        if s['write_boundary']:
+            schema = {'geometry': 'Polygon', 'properties': {'id': 'int'}}
+            with fiona.open(os.path.join(out, 'boundary.shp'), 'w', 'ESRI Shapefile', schema,
+                            crs='epsg:32630') as output:
+                output.write({'geometry': geometry.mapping(shape), 'properties': {'id': 0}})
+        return shape
+
+    def mask(grid, boundary_shape):
+        masking.mask_grid(grid, boundary_shape, tile_size=s['tile_size'])
+        return grid
+
+    def outputs(prepare, mask):
+        # outputs derived from the finished (and masked) grid
+        xi, yi, _ = prepare
+        if s['overview_factors'] or s['geographic']:
+            encoding = netcdf_output.grid_encoding((yi.size, xi.size), s['tile_size'], s['compression'],
+                                                   s['complevel'])
+            with nc.Dataset(mask, 'r+') as ds:
+                if s['overview_factors']:
+                    netcdf_output.write_overviews(ds, ds['elev'], xi, yi, s['overview_factors'],
+                                                  tile_size=s['tile_size'], encoding=encoding)
+                if s['geographic']:
+                    netcdf_output.add_geographic_coordinates(ds, xi, yi, tile_size=s['tile_size'], encoding=encoding)
+        return mask
+
+    pipeline.add('ingest_points', ingest_points, items=lambda result: len(result[0]))
+    pipeline.add('prepare', prepare, after=['ingest_points'], items=lambda result: int(result[2].offsets[-1]))
+    pipeline.add('grid', grid, after=['ingest_points', 'prepare'])
+    if s['boundary_mode'] is None:
+        pipeline.add('mask', lambda grid: grid, after=['grid'])
+    else:
+        pipeline.add('boundary_shape', boundary_shape, after=['ingest_points'])
+        pipeline.add('mask', mask, after=['grid', 'boundary_shape'])
+    pipeline.add('outputs', outputs, after=['prepare', 'mask'])
+    return pipeline
+
+
+def run_survey(settings, workers=2):
+    """
+    Run the pipeline of one survey, returning the path of its NetCDF.
+    settings: dict overriding DEFAULTS.
+    workers: number of stages run at the same time.
+    """
+    s = dict(DEFAULTS, **settings)
+    os.makedirs(s['output_dir'], exist_ok=True)
+    trace_file = os.path.join(s['output_dir'], s['trace_file']) if s['trace_file'] is not None else None
+    trace = instrumentation.Trace(os.path.abspath(s['output_dir']), trace_file, profile=s['profile'])
+    try:
+        return survey_pipeline(settings).run(workers, trace=trace)['outputs']
+    finally:
+        trace.close()
+
+
+def run_surveys(surveys, workers=2, survey_workers=1):
+    """
+    Run the pipelines of several surveys, returning the paths of their NetCDFs in the same order.
+    surveys: list of settings dicts, one per survey, each overriding DEFAULTS.
+    workers: number of stages of one survey run at the same time.
+    survey_workers: number of surveys processed at the same time, each in its own process.
+    """
+    if survey_workers == 1:
+        return [run_survey(settings, workers) for settings in surveys]
+    with ProcessPoolExecutor(max_workers=survey_workers) as pool:
+        return list(pool.map(run_survey, surveys, [workers] * len(surveys)))
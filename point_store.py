@@ -0,0 +1,579 @@
+# Filename: 'point_store.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This module opens the x, y, z point store (e.g. 'bathymetry.npy') memory-mapped, so stages only read the pages they
+# touch and concurrent jobs share the operating system's page cache. Point stores are written column-major (Fortran
+# order) so that each of x, y and z is one contiguous block on disk and slicing a column does not stride over the rows.
+# New survey lines are kept in a delta store next to the store (e.g. 'bathymetry_delta.npy'), read after the store's
+# own points, so updates never rewrite the store or its saved tile index and only the delta store grows.
+# A store can also be sorted along a space-filling curve (Hilbert or Morton) through square tiles, out of core with a
+# counting sort, so nearby points are stored together and each tile's points are one contiguous range of rows. The
+# tile index of a sorted store only holds the first row and point count of each tile, so it is a small sidecar file.
+# Stores can be made compact ('.npz'): coordinates are kept as int32 steps (e.g. centimetres) from an origin in the
+# middle of the survey and elevations as int16, int32 or float32, about 10 bytes a point instead of 24. Each column is
+# an uncompressed member of the .npz, memory-mapped in place and decoded to float64 only where it is read, so every
+# stage can read a compact store in chunks just like a memory-mapped .npy store. np.load also reads it directly.
+
+import io
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+
+COMPACT_COLUMNS = ('x', 'y', 'z')  # .npz member of each column of a compact store
+COMPACT_TYPES = {'int16': np.int16, 'int32': np.int32, 'float32': np.float32}  # elevation types of a compact store
+
+
+def index_path(path='bathymetry.npy'):
+    """
+    Path of the tile index saved next to a point store, e.g. 'bathymetry_tiles.npz' for 'bathymetry.npy' (or for the
+    compact 'bathymetry.npz'), so each store has its own index.
+    path: path to the point store.
+    """
+    return os.path.splitext(path)[0] + '_tiles.npz'
+
+
+def delta_path(path='bathymetry.npy'):
+    """
+    Path of the delta store holding the points added to a point store by updates, e.g. 'bathymetry_delta.npy' for
+    'bathymetry.npy' (or for the compact 'bathymetry.npz').
+    path: path to the point store.
+    """
+    return os.path.splitext(path)[0] + '_delta.npy'
+
+
+def store_files(path='bathymetry.npy'):
+    """
+    Return the files holding the points of a point store: the store and its delta store, if it has one.
+    path: path to the point store.
+    """
+    delta = delta_path(path)
+    return [path, delta] if os.path.exists(delta) else [path]
+
+
+def open_store(path='bathymetry.npy'):
+    """
+    Open a point store memory-mapped read-only, returning the (n, ncols) array without reading it into memory.
+    Compact stores are returned as a CompactStore, which is indexed the same way and decodes what is read.
+    path: path to the .npy (or compact .npz) point store.
+    """
+    if is_compact(path):
+        return CompactStore(path)
+    return np.load(path, mmap_mode='r')
+
+
+def is_compact(path):
+    """
+    Check whether a point store is a compact store written by to_compact.
+    path: path to the point store.
+    """
+    return str(path).endswith('.npz')
+
+
+def is_columnar(path):
+    """
+    Check whether a point store is stored column-major, i.e. each column is contiguous on disk.
+    path: path to the .npy point store, compact stores are always columnar.
+    """
+    if is_compact(path):
+        return True
+    data = open_store(path)
+    return data.ndim == 2 and data.flags.f_contiguous
+
+
+def load_points(path='bathymetry.npy'):
+    """
+    Return the columns of a point store (x, y and z for a full store) as memory-mapped 1D arrays.
+    The columns are contiguous for column-major stores, otherwise they are strided views over the rows. The columns
+    of a compact store are CompactColumns, decoded to float64 as they are sliced or indexed. If the store has a delta
+    store, each column is a ChainedColumn reading the store's points followed by the delta store's.
+    path: path to the .npy (or compact .npz) point store.
+    """
+    data = open_store(path)
+    columns = tuple(data.columns) if is_compact(path) else tuple(data[:, i] for i in range(data.shape[1]))
+    delta = delta_path(path)
+    if os.path.exists(delta):
+        extra = open_store(delta)
+        columns = tuple(ChainedColumn(column, extra[:, i]) for i, column in enumerate(columns))
+    return columns
+
+
+def add_points(path, points, chunk_rows=4 * 1024 ** 2):
+    """
+    Add new points (e.g. survey lines) to the delta store of a point store, returning the number of points in the
+    delta store. The store itself and its saved tile index are left untouched, so the cost depends on the size of
+    the delta store only. The delta store is written to a temporary file and then replaces the old one, so a failed
+    update leaves it as it was.
+    path: path to the .npy (or compact .npz) point store.
+    points: (m, ncols) array-like of new rows (may be memory-mapped), with the same number of columns as the store.
+    chunk_rows: number of rows copied at a time.
+    """
+    ncols = open_store(path).shape[1]
+    if points.shape[1] != ncols:
+        raise ValueError('Cannot add %d columns to a store with %d columns' % (points.shape[1], ncols))
+    delta = delta_path(path)
+    old = open_store(delta) if os.path.exists(delta) else np.zeros((0, ncols))
+    rows, total = len(old), len(old) + len(points)
+    if len(points) == 0:
+        return rows
+    dst = np.lib.format.open_memmap(delta + '.tmp', mode='w+', dtype=np.float64, shape=(total, ncols))
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        dst[start:stop] = old[start:stop]
+    for start in range(0, len(points), chunk_rows):
+        stop = min(start + chunk_rows, len(points))
+        dst[rows + start:rows + stop] = points[start:stop]
+    dst.flush()
+    del dst, old
+    os.replace(delta + '.tmp', delta)
+    return total
+
+
+def to_columnar(path, output=None, chunk_rows=4 * 1024 ** 2):
+    """
+    Rewrite a row-major point store as column-major, copying chunk_rows rows at a time so memory use stays bounded.
+    path: path to the row-major .npy point store.
+    output: path of the column-major store, None replaces the input file.
+    chunk_rows: number of rows copied at a time.
+    """
+    if is_compact(path):
+        return path
+    src = open_store(path)
+    if src.flags.f_contiguous and output is None:
+        return path
+    target = output if output is not None else path + '.tmp'
+    dst = np.lib.format.open_memmap(target, mode='w+', dtype=src.dtype, shape=src.shape, fortran_order=True)
+    for start in range(0, len(src), chunk_rows):
+        dst[start:start + chunk_rows] = src[start:start + chunk_rows]
+    dst.flush()
+    del src, dst
+    if output is None:
+        os.replace(target, path)
+        return path
+    return output
+
+
+def to_compact(path, output=None, xy_scale=0.01, z_type='int16', z_scale=0.01, chunk_rows=4 * 1024 ** 2):
+    """
+    Write a point store as a compact .npz store, returning its path. Eastings and northings are stored as int32 steps
+    of xy_scale from the middle of the survey and elevations as int16 or int32 steps of z_scale, or as float32, so
+    values are rounded to the nearest step. The store is read twice, chunk_rows points at a time, for the ranges and
+    to encode each column.
+    path: path to the .npy point store.
+    output: path of the compact store, None uses path with an .npz suffix.
+    xy_scale: step of the stored coordinates in metres, int32 steps of 0.01 m cover surveys up to about 42 km across.
+    z_type: 'int16', 'int32' or 'float32', int16 steps of 0.01 m cover about 650 m of elevation.
+    z_scale: step of the stored elevations in metres, unused for float32.
+    chunk_rows: number of points read at a time.
+    """
+    if z_type not in COMPACT_TYPES:
+        raise ValueError("Choose an elevation type! 'int16', 'int32' or 'float32'")
+    output = output if output is not None else os.path.splitext(path)[0] + '.npz'
+    src = open_store(path)
+    rows, ncols = src.shape
+    if ncols > len(COMPACT_COLUMNS):
+        raise ValueError('Compact stores hold at most %d columns' % len(COMPACT_COLUMNS))
+    low, high = np.full(ncols, np.inf), np.full(ncols, -np.inf)
+    for start in range(0, rows, chunk_rows):
+        chunk = np.asarray(src[start:start + chunk_rows])
+        low, high = np.minimum(low, chunk.min(axis=0)), np.maximum(high, chunk.max(axis=0))
+    if rows == 0:
+        low, high = np.zeros(ncols), np.zeros(ncols)
+
+    dtypes = [np.dtype(np.int32), np.dtype(np.int32), np.dtype(COMPACT_TYPES[z_type])][:ncols]
+    scale = np.array([xy_scale, xy_scale, z_scale if z_type != 'float32' else 1.0][:ncols], dtype=np.float64)
+    origin = np.round((low + high) / 2 / scale) * scale
+    for i in range(ncols):
+        _check_range(np.array([low[i], high[i]]), origin[i], scale[i], dtypes[i], COMPACT_COLUMNS[i])
+
+    def chunks(i):
+        for start in range(0, rows, chunk_rows):
+            yield _encode(src[start:start + chunk_rows, i], origin[i], scale[i], dtypes[i])
+
+    _write_compact(output + '.tmp', rows, chunks, origin, scale, dtypes)
+    del src
+    os.replace(output + '.tmp', output)
+    return output
+
+
+def _encode(values, origin, scale, dtype):
+    values = np.asarray(values, dtype=np.float64) - origin
+    if dtype.kind == 'f':
+        return (values / scale).astype(dtype)
+    return np.round(values / scale).astype(dtype)
+
+
+def _check_range(values, origin, scale, dtype, name):
+    values = np.asarray(values, dtype=np.float64)
+    if dtype.kind == 'f' or len(values) == 0:
+        return
+    if not np.all(np.isfinite(values)):
+        raise ValueError('%s holds NaN or infinite values, which only a float32 column can store' % name)
+    limit = np.iinfo(dtype).max
+    if np.abs(np.round((values - origin) / scale)).max() > limit:
+        raise ValueError('%s does not fit in %s steps of %g from %g, use a larger step (or a larger type)'
+                         % (name, dtype.name, scale, origin))
+
+
+def _write_compact(path, rows, chunks, origin, scale, dtypes):
+    # each column is an uncompressed .npy member written chunk by chunk, so it can be memory-mapped in place
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for i, dtype in enumerate(dtypes):
+            with zf.open(COMPACT_COLUMNS[i] + '.npy', 'w', force_zip64=True) as fh:
+                np.lib.format.write_array_header_1_0(fh, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                          'fortran_order': False, 'shape': (rows,)})
+                for chunk in chunks(i):
+                    fh.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+        for name, values in (('origin', origin), ('scale', scale)):
+            buffer = io.BytesIO()
+            np.save(buffer, np.asarray(values, dtype=np.float64))
+            zf.writestr(name + '.npy', buffer.getvalue())
+
+
+def _map_member(path, zf, name):
+    # memory-map an uncompressed .npy member of a zip file at its offset in the file
+    info = zf.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        with zf.open(name) as fh:
+            return np.lib.format.read_array(fh)
+    with open(path, 'rb') as fh:
+        fh.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', fh.read(4))
+        fh.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(fh)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(fh)
+        offset = fh.tell()
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+
+class CompactColumn:
+    """
+    Column of a compact store, decoded to float64 only where it is sliced or indexed, so it can be read in chunks like
+    a memory-mapped column. Converting the whole column to an array (e.g. np.asarray) decodes all of it.
+    raw: memory-mapped stored values.
+    origin, scale: a stored value q decodes to origin + q * scale.
+    """
+
+    def __init__(self, raw, origin, scale):
+        self.raw, self.origin, self.scale = raw, float(origin), float(scale)
+        self.shape, self.ndim, self.dtype = raw.shape, 1, np.dtype(np.float64)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        return np.asarray(self.raw[key], dtype=np.float64) * self.scale + self.origin
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.empty(len(self), dtype=np.float64)
+        for start in range(0, len(self), 4 * 1024 ** 2):
+            values[start:start + 4 * 1024 ** 2] = self[start:start + 4 * 1024 ** 2]
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def min(self):
+        return float(self.raw.min()) * self.scale + self.origin  # the step is positive, so the order is kept
+
+    def max(self):
+        return float(self.raw.max()) * self.scale + self.origin
+
+
+class CompactStore:
+    """
+    Compact point store opened read-only. Indexed like an (n, ncols) memory-mapped store: store[:, i] is a
+    CompactColumn and any other selection is decoded to a float64 array.
+    path: path to the .npz store written by to_compact.
+    """
+
+    def __init__(self, path):
+        with zipfile.ZipFile(path) as zf:
+            origin, scale = _map_member(path, zf, 'origin.npy'), _map_member(path, zf, 'scale.npy')
+            self.columns = [CompactColumn(_map_member(path, zf, name + '.npy'), origin[i], scale[i])
+                            for i, name in enumerate(COMPACT_COLUMNS[:len(origin)])]
+        self.path = path
+        self.shape, self.ndim, self.dtype = (len(self.columns[0]), len(self.columns)), 2, np.dtype(np.float64)
+
+    def __repr__(self):
+        return 'CompactStore(%r, %d points, %s)' % (self.path, self.shape[0], ', '.join(
+            '%s %s x %g + %g' % (name, column.raw.dtype.name, column.scale, column.origin)
+            for name, column in zip(COMPACT_COLUMNS, self.columns)))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(columns, (int, np.integer)):
+            column = self.columns[columns]
+            return column if isinstance(rows, slice) and rows == slice(None) else column[rows]
+        return np.column_stack([column[rows] for column in self.columns[columns]])
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.column_stack([np.asarray(column) for column in self.columns])
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+
+class ChainedColumn:
+    """
+    Column of a point store followed by the same column of its delta store, read as one column. Slices and indices
+    are read from the part holding them, so it can be read in chunks like a memory-mapped column.
+    main, delta: the column of the store and of its delta store (memory-mapped arrays or CompactColumns).
+    """
+
+    def __init__(self, main, delta):
+        self.main, self.delta, self.rows = main, delta, len(main)
+        self.shape, self.ndim, self.dtype = (len(main) + len(delta),), 1, np.dtype(np.float64)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            if stop <= self.rows:
+                return self.main[start:stop]
+            if start >= self.rows:
+                return self.delta[start - self.rows:stop - self.rows]
+            return np.concatenate((self.main[start:], self.delta[:stop - self.rows]))
+        if isinstance(key, (int, np.integer)):
+            key = key + len(self) if key < 0 else key
+            return self.main[key] if key < self.rows else self.delta[key - self.rows]
+        key = np.arange(len(self))[key] if isinstance(key, slice) else np.asarray(key)
+        key = np.flatnonzero(key) if key.dtype == bool else np.where(key < 0, key + len(self), key)
+        values = np.empty(key.shape, dtype=np.float64)
+        first = key < self.rows
+        values[first] = self.main[key[first]]
+        values[~first] = self.delta[key[~first] - self.rows]
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.concatenate((np.asarray(self.main, dtype=np.float64), np.asarray(self.delta, dtype=np.float64)))
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def min(self):
+        return min(part.min() for part in (self.main, self.delta) if len(part))
+
+    def max(self):
+        return max(part.max() for part in (self.main, self.delta) if len(part))
+
+
+def curve_codes(tx, ty, curve='hilbert'):
+    """
+    Return the position of tiles (tx, ty) along a space-filling curve, consecutive positions are neighbouring tiles.
+    tx, ty: integer tile coordinates.
+    curve: 'hilbert' (neighbours along the curve always share an edge) or 'morton' (interleaved bits, Z-order).
+    """
+    tx, ty = np.asarray(tx, dtype=np.int64), np.asarray(ty, dtype=np.int64)
+    bits = max(int(max(tx.max(initial=0), ty.max(initial=0))).bit_length(), 1)
+    code = np.zeros(tx.shape, dtype=np.int64)
+    if curve == 'morton':
+        for bit in range(bits):
+            code |= ((tx >> bit) & 1) << (2 * bit) | ((ty >> bit) & 1) << (2 * bit + 1)
+        return code
+    if curve != 'hilbert':
+        raise ValueError("Choose a curve! 'hilbert' or 'morton'")
+    n = 1 << bits
+    x, y = tx.copy(), ty.copy()
+    s = n // 2
+    while s > 0:
+        rx, ry = (x & s) > 0, (y & s) > 0
+        code += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve inside it starts and ends next to its neighbours
+        flip = ~ry & rx
+        x[flip], y[flip] = n - 1 - x[flip], n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s //= 2
+    return code
+
+
+def spatial_sort(path, output=None, extent=512.0, curve='hilbert', chunk_rows=4 * 1024 ** 2):
+    """
+    Sort a point store along a space-filling curve through square tiles, returning the TileIndex of the sorted store.
+    The points of each tile become one contiguous range of rows (in their original order), and neighbouring tiles are
+    mostly stored next to each other. The sort is out of core: one pass finds the bounds, one counts the points of
+    each tile and one scatters chunk_rows points at a time to their place in the output, so memory use is bounded
+    whatever the size of the store. The storage order (row- or column-major) is kept.
+    path: path to the .npy point store.
+    output: path of the sorted store, None replaces the input file.
+    extent: side length of the tiles in metres, e.g. tile_size * resolution of the gridding.
+    curve: 'hilbert' or 'morton', see curve_codes.
+    chunk_rows: number of points read at a time.
+    """
+    if is_compact(path):
+        raise ValueError('Sort the .npy store before making it compact')
+    src = open_store(path)
+    x, y = src[:, 0], src[:, 1]
+    x0, y0, x1, y1 = np.inf, np.inf, -np.inf, -np.inf
+    for start in range(0, len(src), chunk_rows):
+        xs, ys = x[start:start + chunk_rows], y[start:start + chunk_rows]
+        x0, y0, x1, y1 = min(x0, xs.min()), min(y0, ys.min()), max(x1, xs.max()), max(y1, ys.max())
+    if len(src) == 0:
+        x0, y0, x1, y1 = 0.0, 0.0, 0.0, 0.0
+    ntx, nty = int((x1 - x0) // extent) + 1, int((y1 - y0) // extent) + 1
+
+    # position of every tile along the curve, then the first row of each tile in the sorted store
+    ty, tx = np.divmod(np.arange(ntx * nty), ntx)
+    position = np.empty(ntx * nty, dtype=np.int64)
+    position[np.argsort(curve_codes(tx, ty, curve), kind='stable')] = np.arange(ntx * nty)
+    counts = np.zeros(ntx * nty, dtype=np.int64)
+    for start in range(0, len(src), chunk_rows):
+        ids = TileIndex._tile_ids(x[start:start + chunk_rows], y[start:start + chunk_rows], x0, y0, extent, ntx, nty)
+        counts += np.bincount(ids, minlength=ntx * nty)
+    by_position = np.zeros(ntx * nty, dtype=np.int64)
+    by_position[position] = counts
+    starts = (np.cumsum(by_position) - by_position)[position]
+
+    target = output if output is not None else path + '.tmp'
+    dst = np.lib.format.open_memmap(target, mode='w+', dtype=src.dtype, shape=src.shape,
+                                    fortran_order=np.isfortran(src))
+    cursor = starts.copy()
+    for start in range(0, len(src), chunk_rows):
+        chunk = np.asarray(src[start:start + chunk_rows])
+        ids = TileIndex._tile_ids(chunk[:, 0], chunk[:, 1], x0, y0, extent, ntx, nty)
+        order = np.argsort(ids, kind='stable')
+        chunk_counts = np.bincount(ids, minlength=ntx * nty)
+        rank = np.arange(len(ids)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        dst[cursor[ids[order]] + rank] = chunk[order]
+        cursor += chunk_counts
+    dst.flush()
+    del src, x, y, dst
+    if output is None:
+        os.replace(target, path)
+    return TileIndex(x0, y0, extent, ntx, nty, None, np.concatenate(([0], np.cumsum(counts))), starts)
+
+
+class TileIndex:
+    """
+    Bucket the points of a store by square tiles, so the points near one tile can be gathered without scanning the
+    whole store.
+    x0, y0: coordinates of the lower left corner of tile (0, 0).
+    extent: side length of a tile in metres.
+    ntx, nty: number of tiles along x and y.
+    order: point indices sorted by tile, None for a store sorted by spatial_sort (see starts).
+    offsets: start of each tile's points in order, tile (tx, ty) has id ty * ntx + tx.
+    starts: sorted stores only, first row of each tile's points, which are contiguous in the store.
+    """
+
+    def __init__(self, x0, y0, extent, ntx, nty, order, offsets, starts=None):
+        self.x0, self.y0, self.extent = x0, y0, extent
+        self.ntx, self.nty = ntx, nty
+        self.order = order
+        self.offsets = offsets
+        self.starts = starts
+
+    @classmethod
+    def build(cls, x, y, x0, y0, extent, ntx, nty, chunk_rows=4 * 1024 ** 2):
+        """
+        Build the index for points x, y, reading the columns chunk_rows points at a time.
+        """
+        ids = np.empty(len(x), dtype=np.int64)
+        for start in range(0, len(x), chunk_rows):
+            ids[start:start + chunk_rows] = cls._tile_ids(x[start:start + chunk_rows], y[start:start + chunk_rows],
+                                                          x0, y0, extent, ntx, nty)
+        order = np.argsort(ids, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(ids, minlength=ntx * nty))))
+        return cls(x0, y0, extent, ntx, nty, order, offsets)
+
+    def save(self, path):
+        """
+        Save the index to an .npz file, e.g. next to the point store it was built from.
+        """
+        arrays = {'order': self.order} if self.order is not None else {'starts': self.starts}
+        np.savez(path, grid=np.array([self.x0, self.y0, self.extent, self.ntx, self.nty], dtype=np.float64),
+                 offsets=self.offsets, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with save.
+        """
+        with np.load(path) as saved:
+            x0, y0, extent, ntx, nty = saved['grid']
+            if 'order' in saved:
+                return cls(x0, y0, extent, int(ntx), int(nty), saved['order'], saved['offsets'])
+            return cls(x0, y0, extent, int(ntx), int(nty), None, saved['offsets'], saved['starts'])
+
+    def tile_rows(self, tile):
+        """
+        Return the rows of a sorted store holding the points of a tile, as a slice to read them in one go.
+        """
+        return slice(int(self.starts[tile]), int(self.starts[tile] + self.offsets[tile + 1] - self.offsets[tile]))
+
+    def tiles_near(self, x, y, distance):
+        """
+        Return the sorted ids of the tiles within distance of any of the points x, y (e.g. new points plus a halo).
+        """
+        x, y = np.asarray(x), np.asarray(y)
+        tx0, tx1 = [np.clip(np.floor((x + d - self.x0) / self.extent).astype(np.int64), 0, self.ntx - 1)
+                    for d in (-distance, distance)]
+        ty0, ty1 = [np.clip(np.floor((y + d - self.y0) / self.extent).astype(np.int64), 0, self.nty - 1)
+                    for d in (-distance, distance)]
+        span = int(np.ceil(2 * distance / self.extent)) + 1
+        ids = [(ty0 + j) * self.ntx + tx0 + i for j in range(span) for i in range(span)]
+        keep = [(tx0 + i <= tx1) & (ty0 + j <= ty1) for j in range(span) for i in range(span)]
+        return np.unique(np.concatenate([tile[k] for tile, k in zip(ids, keep)]))
+
+    @staticmethod
+    def _tile_ids(x, y, x0, y0, extent, ntx, nty):
+        tx = np.clip(np.floor((np.asarray(x) - x0) / extent).astype(np.int64), 0, ntx - 1)
+        ty = np.clip(np.floor((np.asarray(y) - y0) / extent).astype(np.int64), 0, nty - 1)
+        return ty * ntx + tx
+
+    def window(self, x, y, xmin, xmax, ymin, ymax):
+        """
+        Return the sorted indices of the points inside a rectangular window.
+        x, y: point coordinates the index was built from.
+        xmin, xmax, ymin, ymax: bounds of the window (inclusive).
+        """
+        tx0, tx1 = np.clip(np.floor((np.array([xmin, xmax]) - self.x0) / self.extent).astype(int), 0, self.ntx - 1)
+        ty0, ty1 = np.clip(np.floor((np.array([ymin, ymax]) - self.y0) / self.extent).astype(int), 0, self.nty - 1)
+        if self.order is None:
+            # each tile of a sorted store is one range of rows and tiles next to each other along the curve are
+            # neighbouring ranges, so the window is read as a few contiguous slices without gathering or sorting
+            tiles = (np.arange(ty0, ty1 + 1)[:, np.newaxis] * self.ntx + np.arange(tx0, tx1 + 1)).ravel()
+            tiles = tiles[np.argsort(self.starts[tiles])]
+            first, last = self.starts[tiles], self.starts[tiles] + np.diff(self.offsets)[tiles]
+            new_run = np.concatenate(([True], first[1:] != last[:-1]))
+            runs = list(zip(first[new_run], last[np.concatenate((new_run[1:], [True]))]))
+            idx = np.concatenate([np.arange(a, b) for a, b in runs])
+            xs, ys = np.concatenate([x[a:b] for a, b in runs]), np.concatenate([y[a:b] for a, b in runs])
+        else:
+            # the tiles of one tile row are consecutive in the index, so each row of the window is a single slice
+            idx = np.concatenate([self.order[self.offsets[ty * self.ntx + tx0]:self.offsets[ty * self.ntx + tx1 + 1]]
+                                  for ty in range(ty0, ty1 + 1)])
+            idx.sort()  # read the memory-mapped columns in file order
+            xs, ys = x[idx], y[idx]
+        return idx[(xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)]
+
+
+class ChainedIndex:
+    """
+    Tile index of a point store with a delta store, on the same tiles: the store's own saved index is kept as it is
+    and the (smaller) delta store has its own index, so adding points never rebuilds or rewrites the store's index.
+    main: TileIndex of the store's own points.
+    delta: TileIndex of the delta store's points, counted from its first row.
+    """
+
+    def __init__(self, main, delta):
+        self.main, self.delta = main, delta
+        self.x0, self.y0, self.extent, self.ntx, self.nty = main.x0, main.y0, main.extent, main.ntx, main.nty
+
+    def tiles_near(self, x, y, distance):
+        """
+        Return the sorted ids of the tiles within distance of any of the points x, y, see TileIndex.tiles_near.
+        """
+        return self.main.tiles_near(x, y, distance)
+
+    def window(self, x, y, xmin, xmax, ymin, ymax):
+        """
+        Return the sorted indices of the points inside a rectangular window, see TileIndex.window.
+        x, y: ChainedColumns of the store and its delta store (as returned by load_points).
+        """
+        idx = self.main.window(x.main, y.main, xmin, xmax, ymin, ymax)
+        return np.concatenate((idx, self.delta.window(x.delta, y.delta, xmin, xmax, ymin, ymax) + x.rows))
@@ -0,0 +1,31 @@
+# Filename: 'run_pipeline.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This script runs the whole workflow (the steps of 'txt_to_npy.py', 'npy_to_nc_UTM.py', 'boundary_generation.py'
+# and 'mask_nc_UTM.py') for one or more surveys in a single process, passing data between the stages in memory and
+# generating the boundary while the grid is interpolated. Each survey gets its own settings and output directory,
+# any setting not given takes the default listed in pipeline.DEFAULTS.
+
+import instrumentation
+import pipeline
+
+surveys = [
+    {'input_file': 'bathymetry.npy', 'output_dir': '.', 'elevation_offset': 49.32},
+]  # one dict of settings per survey, e.g. {'input_file': 'survey2.txt', 'output_dir': 'survey2', 'resolution': 2}
+workers = 2  # stages of one survey run at the same time, e.g. gridding and boundary generation
+survey_workers = 1  # surveys processed at the same time, each in its own process
+
+trace = instrumentation.Trace('run_pipeline')  # calculating run times, each survey writes its own 'trace_file'
+
+dt_string = trace.started.strftime("%d/%m/%Y %H:%M:%S")
+print("Simulation start: ", dt_string, '\n')
+
+outputs = pipeline.run_surveys(surveys, workers=workers, survey_workers=survey_workers)
+
+for output in outputs:
+    print('Written', output)
+
+simulationtime = trace.close()  # calculate simulation time
+
+print('Pipeline finished, total process time = ', simulationtime)
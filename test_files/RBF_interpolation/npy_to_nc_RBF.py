@@ -11,6 +11,11 @@ from scipy.interpolate import RBFInterpolator
 import netCDF4 as nc
 from datetime import datetime
 import pyproj
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import point_store  # noqa: E402
 
 starttime = datetime.now()  # calculating run times
 
@@ -22,21 +27,17 @@ transformer = pyproj.Transformer.from_crs("EPSG:32630", "EPSG:4326", always_xy=T
 
 print('Modules imported... (', datetime.now() - starttime, ')')
 
-data = np.load('bathymetry.npy')
+X_UTM, Y_UTM, Elevation = point_store.load_points('bathymetry.npy')  # memory-mapped x, y and z columns
 
 print('Bathymetry data loaded... (', datetime.now() - starttime, ')')
 
-X_UTM = data[:, 0]
-Y_UTM = data[:, 1]
-Elevation = data[:, 2]
-
 # Assign NaN (Not a Number) to land points (invalid points) -  prevents errors from occurring but does not
 # impact interpolation
 elev_list = np.array([n if n != 0. else np.nan for n in Elevation])
 
 print('Data sliced... (', datetime.now() - starttime, ')')
 
-min_X_UTM, max_X_UTM, min_Y_UTM, max_Y_UTM = min(X_UTM), max(X_UTM), min(Y_UTM), max(Y_UTM)
+min_X_UTM, max_X_UTM, min_Y_UTM, max_Y_UTM = X_UTM.min(), X_UTM.max(), Y_UTM.min(), Y_UTM.max()
 
 resolution = 2  # desired resolution in m
 x_number = np.abs(max_X_UTM-min_X_UTM) / resolution
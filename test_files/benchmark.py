@@ -0,0 +1,206 @@
+# Filename: 'benchmark.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This script benchmarks the stages of the workflow on synthetic bathymetry surveys of increasing size. Each survey
+# has an irregular coastline with a strip of land points (elevation <= 0), islands, unsurveyed gaps and points laid
+# out along survey lines. Every stage runs in its own process so its peak memory (resident set size) can be measured,
+# and the time, items per second (points, or grid nodes for the NetCDF write) and peak memory of each stage are
+# compared with a stored baseline.
+# Run with no arguments. The script calls itself with arguments (stage, number of points, work directory) to run
+# each stage in a child process.
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+from scipy.interpolate import griddata
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import boundary  # noqa: E402
+import gridding  # noqa: E402
+import ingest  # noqa: E402
+import netcdf_output  # noqa: E402
+import point_store  # noqa: E402
+
+sizes = [10 ** 4, 10 ** 5, 10 ** 6]  # points per synthetic survey, up to 10 ** 8 on a large node
+stages = ['ingest', 'griddata', 'tiled_nearest', 'tiled_linear', 'reduction', 'alpha_custom', 'alphashapes',
+          'netcdf_write']  # run in this order, netcdf_write writes the grid of tiled_nearest
+stage_limits = {'griddata': 10 ** 5, 'alphashapes': 10 ** 5, 'alpha_custom': 10 ** 7}  # largest survey of slow stages
+griddata_method = 'linear'  # method of the griddata stage (npy_to_nc_UTM.py full mode), 'nearest', 'linear' or 'cubic'
+density = 1.0  # points per m2, sets the survey area
+resolution = 1.0  # m, grid resolution of the gridding and NetCDF stages
+alpha = 0.2  # alpha of both alpha shape stages
+work_dir = 'benchmark_work'  # synthetic surveys and stage outputs, deleted at the end
+results_file = 'benchmark_results.json'  # measurements of this run
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+update_baseline = False  # store this run as the new baseline
+tolerance = 0.2  # fractional slow-down or memory growth against the baseline reported as a regression
+chunk_rows = 10 ** 6  # points generated at a time
+
+
+def synthetic_survey(n, seed=0):
+    """
+    Yield chunks of an (n, 3) synthetic x, y, elevation survey in UTM coordinates.
+    Points lie inside an irregular coastline plus a land strip beyond it, with islands (land points) and gaps (no
+    points), along survey lines 2 m apart. Elevations are positive depths at sea and <= 0 on land.
+    n: number of points.
+    seed: random seed, the same seed always gives the same survey.
+    """
+    rng = np.random.default_rng(seed)
+    radius = np.sqrt(n / density / np.pi) * 0.95  # mean coastline radius, the land strip fills the rest
+    x0, y0 = 489000 + 1.2 * radius, 6500000 + 1.2 * radius
+    islands = np.column_stack((rng.uniform(-0.5, 0.5, (3, 2)) * radius, rng.uniform(0.03, 0.08, 3) * radius))
+    gaps = np.column_stack((rng.uniform(-0.6, 0.6, (2, 2)) * radius, rng.uniform(0.02, 0.06, 2) * radius))
+
+    def coast(theta):
+        return radius * (1 + 0.15 * np.sin(3 * theta) + 0.08 * np.sin(7 * theta + 1) + 0.04 * np.sin(17 * theta + 2))
+
+    done = 0
+    while done < n:
+        m = min(chunk_rows, n - done)
+        x = rng.uniform(-1.2, 1.2, 2 * m) * radius
+        y = rng.uniform(-1.2, 1.2, 2 * m) * radius
+        x = np.round(x / 2) * 2 + rng.normal(0, 0.1, x.size)  # survey lines
+        r, theta = np.hypot(x, y), np.arctan2(y, x)
+        shore = coast(theta)
+        keep = r < shore * 1.05  # sea plus a land strip
+        for gx, gy, gr in gaps:
+            keep &= np.hypot(x - gx, y - gy) > gr
+        x, y, r, shore = x[keep][:m], y[keep][:m], r[keep][:m], shore[keep][:m]
+        z = 5 + 40 * (1 - r / shore) + 3 * np.sin(x / 150) * np.cos(y / 90) + rng.normal(0, 0.05, x.size)
+        z[r >= shore] = -rng.uniform(0, 5, np.sum(r >= shore))
+        for ix, iy, ir in islands:
+            on_island = np.hypot(x - ix, y - iy) < ir
+            z[on_island] = -rng.uniform(0, 10, on_island.sum())
+        done += x.size
+        yield np.column_stack((x + x0, y + y0, z))
+
+
+def make_survey(n, folder):
+    """
+    Write a synthetic survey of n points as 'survey.txt' and the column-major 'survey.npy' in folder.
+    """
+    store = np.lib.format.open_memmap(os.path.join(folder, 'survey.npy'), mode='w+', dtype=np.float64,
+                                      shape=(n, 3), fortran_order=True)
+    row = 0
+    with open(os.path.join(folder, 'survey.txt'), 'w') as fh:
+        fh.write('x,y,z\n')
+        for chunk in synthetic_survey(n):
+            np.savetxt(fh, chunk, fmt='%.2f', delimiter=',')
+            store[row:row + len(chunk)] = chunk
+            row += len(chunk)
+    store.flush()
+
+
+def grid_coordinates(x, y):
+    return np.arange(x.min(), x.max() + resolution, resolution), np.arange(y.min(), y.max() + resolution, resolution)
+
+
+def run_stage(stage, n, folder):
+    """
+    Run one stage on the survey in folder, returning the number of items it processed.
+    """
+    if stage == 'ingest':
+        rows = ingest.stream_txt_to_npy(os.path.join(folder, 'survey.txt'), os.path.join(folder, 'ingested.npy'))
+        point_store.to_columnar(os.path.join(folder, 'ingested.npy'))
+        return rows
+    x, y, z = point_store.load_points(os.path.join(folder, 'survey.npy'))
+    if stage == 'griddata':
+        # whole grid at once, as the default full grid mode of npy_to_nc_UTM.py
+        xi, yi = grid_coordinates(x, y)
+        xx, yy = np.meshgrid(xi, yi, indexing='ij')
+        griddata((x, y), np.where(np.asarray(z) <= 0, np.nan, z), (xx, yy), method=griddata_method)
+        return n
+    if stage in ('tiled_nearest', 'tiled_linear'):
+        xi, yi = grid_coordinates(x, y)
+        out = np.lib.format.open_memmap(os.path.join(folder, stage + '.npy'), mode='w+', dtype=np.float32,
+                                        shape=(yi.size, xi.size))
+        gridding.grid_tiled(x, y, z, xi, yi, out, method=stage[len('tiled_'):],
+                            preprocess=lambda elevation: np.where(elevation <= 0, np.nan, elevation))
+        out.flush()
+        return n
+    if stage == 'reduction':
+        cx, cy, half = (x.min() + x.max()) / 2, (y.min() + y.max()) / 2, (x.max() - x.min()) / 8
+        regions = boundary.rectangles_to_regions([cx - half, cx + half], [cy - half, cy + 2 * half],
+                                                 [cx, cx + 2 * half], [cy + half, cy + 3 * half])
+        boundary.reduce_points(x, y, regions, os.path.join(folder, 'reduced.npy'))
+        return n
+    if stage == 'alpha_custom':
+        boundary.alpha_shape(np.column_stack((x, y)), alpha)
+        return n
+    if stage == 'alphashapes':
+        import alphashape
+        alphashape.alphashape(np.column_stack((x, y)), alpha)
+        return n
+    if stage == 'netcdf_write':
+        xi, yi = grid_coordinates(x, y)
+        grid = np.load(os.path.join(folder, 'tiled_nearest.npy'), mmap_mode='r')
+        encoding = netcdf_output.grid_encoding(grid.shape)
+        ds, elev = netcdf_output.create_utm_dataset(os.path.join(folder, 'grid.nc'), xi, yi, encoding=encoding)
+        for ys in gridding.tile_slices(yi.size, 1024):
+            elev[ys, :] = grid[ys]
+        ds.close()
+        return grid.size
+    raise ValueError('Unknown stage %r' % stage)
+
+
+if len(sys.argv) > 1:
+    # child process: run one stage and report its measurements as the last line of output
+    stage, n, folder = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    t0, c0 = time.perf_counter(), time.process_time()
+    items = run_stage(stage, n, folder)
+    seconds, cpu = time.perf_counter() - t0, time.process_time() - c0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+    print(json.dumps({'seconds': seconds, 'cpu_seconds': cpu, 'items': items, 'peak_rss_mb': peak}))
+    sys.exit(0)
+
+baseline = {}
+if os.path.exists(baseline_file):
+    with open(baseline_file) as fh:
+        baseline = json.load(fh)
+
+results = {}
+print('%-14s %10s %10s %14s %14s   %s' % ('Stage', 'Points', 'Time (s)', 'Items/s', 'Peak RSS (MB)', 'Baseline'))
+os.makedirs(work_dir, exist_ok=True)
+for n in sizes:
+    folder = os.path.join(work_dir, str(n))
+    os.makedirs(folder, exist_ok=True)
+    make_survey(n, folder)
+    for stage in stages:
+        if n > stage_limits.get(stage, n):
+            continue
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), stage, str(n), folder],
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print('%-14s %10d failed:\n%s' % (stage, n, child.stderr))
+            continue
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        result['items_per_second'] = result['items'] / max(result['seconds'], 1e-9)  # grid nodes for netcdf_write
+        name = '%s/%d' % (stage, n)
+        results[name] = result
+
+        comparison = 'none'
+        if name in baseline:
+            speed = result['seconds'] / baseline[name]['seconds']
+            memory = result['peak_rss_mb'] / baseline[name]['peak_rss_mb']
+            comparison = 'time x%.2f, memory x%.2f' % (speed, memory)
+            if speed > 1 + tolerance:
+                comparison += ' SLOWER'
+            if memory > 1 + tolerance:
+                comparison += ' MORE MEMORY'
+        print('%-14s %10d %10.2f %14.0f %14.1f   %s' % (stage, n, result['seconds'], result['items_per_second'],
+                                                       result['peak_rss_mb'], comparison))
+    shutil.rmtree(folder)
+
+with open(results_file, 'w') as fh:
+    json.dump(results, fh, indent=1)
+if update_baseline is True:
+    with open(baseline_file, 'w') as fh:
+        json.dump(results, fh, indent=1)
+    print('Baseline updated')
+shutil.rmtree(work_dir)
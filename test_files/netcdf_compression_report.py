@@ -0,0 +1,70 @@
+# Filename: 'netcdf_compression_report.py'
+# Date: 17/10/2026
+# Author: Connor Jordan
+# Institution: University of Edinburgh (IIE)
+# This script compares NetCDF output settings (compression, shuffle, chunking and quantization) for a gridded
+# bathymetry. For each setting it reports the write time, the file size and the latency of reading a small window,
+# which is what QGIS does when zoomed in on part of a large grid.
+
+import os
+import sys
+import time
+import numpy as np
+import netCDF4 as nc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import netcdf_output  # noqa: E402
+
+source = '../bathymetry_UTM.nc'  # grid to re-encode, a synthetic grid is used if this file does not exist
+synthetic_shape = (4000, 6000)  # (ny, nx) of the synthetic grid
+window = 256  # side length of the window read back
+repeats = 5  # windowed reads timed per setting
+
+settings = {
+    'uncompressed, default chunks': None,
+    'zlib 1 + shuffle, 1024 tiles': netcdf_output.grid_encoding(synthetic_shape, 1024, 'zlib', 1, True),
+    'zlib 4 + shuffle, 1024 tiles': netcdf_output.grid_encoding(synthetic_shape, 1024, 'zlib', 4, True),
+    'zlib 4, no shuffle, 1024 tiles': netcdf_output.grid_encoding(synthetic_shape, 1024, 'zlib', 4, False),
+    'zlib 4 + shuffle, 256 tiles': netcdf_output.grid_encoding(synthetic_shape, 256, 'zlib', 4, True),
+    'zlib 4 + shuffle + cm quantization': netcdf_output.grid_encoding(synthetic_shape, 1024, 'zlib', 4, True, 2),
+}
+
+if os.path.exists(source):
+    with nc.Dataset(source) as ds:
+        xi, yi = ds['x'][:].data, ds['y'][:].data
+        grid = ds['elev'][:].filled(np.nan)
+else:
+    # smooth seabed with noise at the centimetre level and a NaN (land) region, similar to a nearest neighbour grid
+    yi = 6501000 + 0.5 * np.arange(synthetic_shape[0])
+    xi = 489000 + 0.5 * np.arange(synthetic_shape[1])
+    rng = np.random.default_rng(0)
+    grid = 30 + 10 * np.sin(xi[np.newaxis, :] / 150) * np.cos(yi[:, np.newaxis] / 90)
+    grid = grid + rng.normal(0, 0.05, grid.shape)
+    grid[:synthetic_shape[0] // 4, :synthetic_shape[1] // 3] = np.nan
+
+print('%-36s %10s %10s %14s' % ('Setting', 'Write (s)', 'Size (MB)', 'Window (ms)'))
+
+for name, encoding in settings.items():
+    if encoding is not None:
+        encoding['chunksizes'] = tuple(min(c, n) for c, n in zip(encoding['chunksizes'], grid.shape))
+    path = 'compression_report.nc'
+
+    t0 = time.perf_counter()
+    ds, elev = netcdf_output.create_utm_dataset(path, xi, yi, encoding=encoding)
+    elev[:, :] = grid
+    ds.close()
+    write_time = time.perf_counter() - t0
+
+    size = os.path.getsize(path) / 1024 ** 2
+
+    j0, i0 = grid.shape[0] // 2, grid.shape[1] // 2
+    latencies = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        with nc.Dataset(path) as ds:
+            ds['elev'][j0:j0 + window, i0:i0 + window]
+        latencies.append(time.perf_counter() - t0)
+
+    print('%-36s %10.2f %10.1f %14.2f' % (name, write_time, size, 1000 * np.median(latencies)))
+
+os.remove('compression_report.nc')
@@ -4,23 +4,135 @@
 # Institution: University of Edinburgh (IIE)
 # This script extracts elevation data from a .txt file and converts to an .npy file.
 
+import os
+import shutil
 import numpy as np
-from datetime import datetime
+import ingest
+import instrumentation
+import point_store
+from cache import Cache
 
-starttime = datetime.now()  # to calculate script runtime
+input_file = '3475 Stroma AllData WGS84.txt'
+output_file = 'bathymetry.npy'
+mode = 'streaming'  # choose 'loadtxt' (whole file in memory), 'streaming' (chunked), 'parallel' (multi-core) or 'files'
+chunk_size = 64 * 1024 ** 2  # bytes parsed at a time in streaming mode, sets the peak memory use
+workers = None  # number of processes used in parallel mode, None uses every core
+input_patterns = ['tiles/*.txt', 'tiles/*.txt.gz', 'tiles/*.csv.xz']  # survey tiles combined in 'files' mode
+manifest = None  # optional text file listing survey tiles (one per line) for 'files' mode
+readers = 4  # number of tiles decompressed and parsed concurrently in 'files' mode
+columnar = True  # store x, y and z column-major so later stages can memory-map each column as one contiguous block
+spatial_sort = True  # sort the points along a space-filling curve through square tiles, so nearby points are stored
+# together and each tile is one contiguous range of rows, and save the tile index of the sorted store next to it (e.g.
+# 'bathymetry_tiles.npz' for 'bathymetry.npy'), an index left from an unsorted older store of that name is deleted
+sort_extent = 512  # m, side of the sorting tiles, tile_size * resolution of 'npy_to_nc_UTM.py' lets it use the index
+sort_curve = 'hilbert'  # choose 'hilbert' or 'morton' (Z-order)
+compact = False  # store the points as output_file with an .npz suffix instead, coordinates as int32 steps of xy_scale
+# from the middle of the survey and elevations as z_type, about 10 bytes a point instead of 24, point_file in the later
+# scripts must then name the .npz
+xy_scale = 0.01  # m, step of the compact coordinates, int32 steps of 0.01 m cover surveys up to about 42 km across
+z_type = 'int16'  # compact elevations, 'int16' (steps of z_scale, about 650 m range at 0.01 m), 'int32' or 'float32'
+z_scale = 0.01  # m, step of the compact elevations
+cache_dir = '.cache'  # cache of parsed point stores keyed on the input file contents, None to always parse
+cache_size = 20 * 1024 ** 3  # bytes, least recently used cache entries are deleted beyond this
+trace_file = 'txt_to_npy_trace.json'  # per-step time, CPU, peak memory, IO and item counts (.json or .csv), or None
+profile = False  # also sample the Python stacks, written to trace_file + '.folded' for flame graph tools
 
-dt_string = starttime.strftime("%d/%m/%Y %H:%M:%S")
+trace = instrumentation.Trace('txt_to_npy', trace_file, profile=profile)  # records each step, to calculate runtime
+
+store_file = os.path.splitext(output_file)[0] + '.npz' if compact is True else output_file  # the finished store
+index_file = point_store.index_path(store_file)  # tile index of the sorted store, named after it
+
+dt_string = trace.started.strftime("%d/%m/%Y %H:%M:%S")
 print("Simulation start: ", dt_string, '\n')
 
-# This loads ASCII (character encoding standard for electronic communication, ASCII codes represent text in
-# computers) data stored in a delimited text file (.txt). The shape of the output is (n, 1) where n = no. of lines
-# because each line of data is represented as a tuple, so there are n lines of tuples. Skip first row i.e. headers.
-data = np.loadtxt('3475 Stroma AllData WGS84.txt', delimiter=",", skiprows=1)  # output: n times 1 array of tuples
+cache, key, cached = None, None, None
+if cache_dir is not None:
+    # The point store only depends on the contents of the input files and the storage order, not on the mode
+    cache = Cache(cache_dir, cache_size)
+    input_files = [input_file] if mode != 'files' else ingest.resolve_inputs(input_patterns, manifest)
+    key = cache.key('txt_to_npy', [cache.file_digest(path) for path in input_files], columnar,
+                    (sort_extent, sort_curve) if spatial_sort is True else None,
+                    (xy_scale, z_type, z_scale) if compact is True else None)
+    cached = cache.get(key)
+    if spatial_sort is True and cache.get(key, '.npz') is None:
+        cached = None  # the sorted store is only usable with its tile index
+    trace.step('hash_inputs', items=len(input_files))
 
-simulationtime = datetime.now() - starttime  # calculate simulation time
+if cached is not None:
+    # Unchanged inputs were parsed before, copy the cached point store instead of parsing again
+    shutil.copyfile(cached, store_file)
+    if spatial_sort is True:
+        shutil.copyfile(cache.get(key, '.npz'), index_file)
+    data = point_store.open_store(store_file)
+    trace.step('copy_cached', 'Point store copied from the cache', items=len(data))
+elif mode == 'loadtxt':
+    # This loads ASCII (character encoding standard for electronic communication, ASCII codes represent text in
+    # computers) data stored in a delimited text file (.txt). The shape of the output is (n, 1) where n = no. of lines
+    # because each line of data is represented as a tuple, so there are n lines of tuples. Skip first row i.e. headers.
+    data = np.loadtxt(input_file, delimiter=",", skiprows=1)  # output: n times 1 array of tuples
+    np.save(output_file, np.asfortranarray(data) if columnar is True else data)
+    trace.step('parse', 'Text parsed', items=len(data))
+elif mode == 'streaming':
+    # Read the file in chunks cut on line endings and append each parsed chunk to the .npy file, so the whole
+    # survey is never held in memory at once
+    rows = ingest.stream_txt_to_npy(input_file, output_file, delimiter=",", skiprows=1, chunk_size=chunk_size)
+    trace.step('parse', 'Text parsed', items=rows)
+    print('Number of points = ', rows)
+    data = np.load(output_file, mmap_mode='r')
+elif mode == 'parallel':
+    # Split the file into byte ranges on line endings and parse them in a process pool, each worker writing its rows
+    # straight into its own slice of the memory-mapped output
+    rows = ingest.parallel_txt_to_npy(input_file, output_file, delimiter=",", skiprows=1, workers=workers,
+                                      columnar=columnar)
+    trace.step('parse', 'Text parsed', items=rows)
+    print('Number of points = ', rows)
+    data = np.load(output_file, mmap_mode='r')
+elif mode == 'files':
+    # Concatenate many (optionally compressed) survey tiles into one point store, decompressing them as streams
+    input_files = ingest.resolve_inputs(input_patterns, manifest)
+    print('Number of input files = ', len(input_files))
+    rows = ingest.ingest_files(input_files, output_file, delimiter=",", skiprows=1, readers=readers)
+    trace.step('parse', 'Text parsed', items=rows)
+    print('Number of points = ', rows)
+    data = np.load(output_file, mmap_mode='r')
+else:
+    raise ValueError("Choose a mode! 'loadtxt', 'streaming', 'parallel' or 'files'")
 
-print('Unpacking time = ', simulationtime)
+if cached is None and spatial_sort is True:
+    # out-of-core counting sort by tile along the curve, done before the transpose so whole rows are scattered
+    del data
+    point_store.spatial_sort(output_file, extent=sort_extent, curve=sort_curve).save(index_file)
+    data = point_store.open_store(output_file)
+    trace.step('spatial_sort', 'Points sorted along a %s curve' % sort_curve, items=len(data))
+elif spatial_sort is not True and os.path.exists(index_file):
+    os.remove(index_file)  # the saved tile index described the previous store
+if os.path.exists(point_store.delta_path(store_file)):
+    os.remove(point_store.delta_path(store_file))  # points added to the previous store by updates
+
+if cached is None and columnar is True and mode in ('streaming', 'files'):
+    # rows are appended as they are parsed, so transpose the finished store to column-major in bounded chunks
+    del data
+    point_store.to_columnar(output_file)
+    data = point_store.open_store(output_file)
+    trace.step('columnar', 'Point store made column-major', items=len(data))
 
-np.save('bathymetry.npy', data)
+if cached is None and compact is True:
+    # quantize each column in chunks, then drop the float64 store
+    del data
+    point_store.to_compact(output_file, store_file, xy_scale=xy_scale, z_type=z_type, z_scale=z_scale)
+    os.remove(output_file)
+    data = point_store.open_store(store_file)
+    trace.step('compact', 'Point store made compact (%.1f bytes a point)' % (os.path.getsize(store_file) /
+                                                                           max(len(data), 1)), items=len(data))
+
+if cache is not None and cached is None:
+    cache.put(key, lambda path: shutil.copyfile(store_file, path))
+    if spatial_sort is True:
+        cache.put(key, lambda path: shutil.copyfile(index_file, path), '.npz')
+    trace.step('cache_put', items=len(data))
+
+simulationtime = trace.close()  # calculate simulation time and write the trace
+
+print('Unpacking time = ', simulationtime)
 
 print(data)